@@ -1,140 +1,14 @@
-from flask import Flask, request, render_template_string, session
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
-import requests
-import re
-import random
-from markupsafe import Markup
-import base64
 
+# 各モジュールは import 時に環境変数を読むので、先に .env を読み込んでおく
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY")
-
-
-
-client = OpenAI()
-   
-
-
-
-#お土産Wikipedia画像表示
-def get_wikipedia_image(title):
-    url = "https://ja.wikipedia.org/w/api.php"
-    params = {
-        "action": "query",
-        "format": "json",
-        "titles": title,
-        "prop": "pageimages",
-        "pithumbsize": 300,
-        "redirects": 1
-    }
-
-    headers = {
-        "User-Agent": "zemiapp/1.0 (https://example.com)"
-    }
-
-    res = requests.get(url, params=params, headers=headers)
-
-    if res.status_code != 200:
-        return None
-
-    data = res.json()
-
-    pages = data.get("query", {}).get("pages", {})
-    for page in pages.values():
-        if "thumbnail" in page:
-            return page["thumbnail"]["source"]
-
-    return None
-
-
-#旅行プランのWikipedia記述
-WIKI_ENDPOINT = "https://ja.wikipedia.org/w/api.php"
-
-def wiki_search_titles(query: str, limit: int = 10):
-    params = {
-        "action": "query",
-        "list": "search",
-        "srsearch": query,
-        "format": "json",
-        "srlimit": str(limit),
-    }
-    headers = {
-        "User-Agent": "TripPlannerApp/1.0 (edu; contact: student@example.com)",
-        "Accept-Language": "ja,en;q=0.8",
-    }
-    r = requests.get(WIKI_ENDPOINT, params=params, headers=headers, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    titles = []
-    for item in data.get("query", {}).get("search", []):
-        title = item.get("title", "")
-        title = re.sub(r"<.*?>", "", title)
-        if title:
-            titles.append(title)
-    return titles
-
-def build_trip(destination: str, days: int, style: str):
-    candidates = []
-    for q in [f"{destination} 観光", f"{destination} 名所", f"{destination} 寺", f"{destination} 神社"]:
-        candidates += wiki_search_titles(q, limit=10)
-
-    # 重複除去
-    seen = set()
-    pool = []
-    for t in candidates:
-        if t not in seen:
-            seen.add(t)
-            pool.append(t)
-
-    if len(pool) < days * 5:
-        pool += [
-            f"{destination}中心街散策",
-            f"{destination}の寺社エリア",
-            f"{destination}の景色スポット",
-            f"{destination}の商店街・市場",
-            f"{destination}の文化施設",
-            f"{destination}の自然スポット",
-        ]
-
-    if "食べ歩き" in style:
-        tips_base = "食べ歩きがしやすいエリアを中心に。混む時間をずらすと◎"
-    elif "写真映え" in style:
-        tips_base = "光が綺麗な夕方を意識。たくさんの場所を回れるように移動時間は少なめに。"
-    elif "ゆったり" in style:
-        tips_base = "移動少なめ。カフェ休憩を挟んでゆったり回る。"
-    else:
-        tips_base = "王道スポットは朝に。午後は近場でまとめると効率的。"
-
-    time_slots = ["09:00", "11:00", "12:30", "15:00", "18:00"]
-    labels = ["朝", "午前", "昼", "午後", "夜"]
-
-    random.shuffle(pool)
-    need = days * len(time_slots)
-    picks = pool[:need] if len(pool) >= need else (pool * ((need // len(pool)) + 1))[:need]
-
-    plan = []
-    idx = 0
-    for d in range(1, days + 1):
-        schedule = []
-        for i, t in enumerate(time_slots):
-            title = picks[idx]
-            idx += 1
-            if labels[i] == "昼":
-                detail = "近くで休憩・ランチを想定。無理のない移動距離で。"
-            else:
-                detail = "同じエリア内で無理なく巡るプランです。"
-            schedule.append({
-                "time": t,
-                "title": title,
-                "detail": detail,
-                "tips": tips_base
-            })
-        plan.append({"day": d, "schedule": schedule})
-    return plan
+import clients
+import factory
+import ledger
+import offline
+import receipts
 
 
 #お土産検索のhtmlを記載
@@ -486,6 +360,57 @@ ul.option-list li.active {
   font-size: 14px;
 }
 
+.breakdown-row {
+  display: flex;
+  justify-content: space-between;
+  font-size: 13px;
+  margin: 8px 0 4px;
+}
+
+.breakdown-bar {
+  height: 6px;
+  background: #f1e4d6;
+  border-radius: 3px;
+  overflow: hidden;
+}
+
+.breakdown-bar > div {
+  height: 100%;
+}
+
+/* 履歴は見えている行だけを置くので、行の高さは JS の HISTORY_ROW_HEIGHT と合わせる */
+#historyArea {
+  max-height: 60vh;
+  overflow-y: auto;
+}
+
+.history-spacer {
+  position: relative;
+}
+
+.history-row {
+  position: absolute;
+  left: 0;
+  right: 0;
+  height: 86px;
+  margin: 0;
+  box-sizing: border-box;
+  display: flex;
+  justify-content: space-between;
+  align-items: center;
+  overflow: hidden;
+}
+
+.history-delete {
+  background: #ff6b6b;
+  color: #fff;
+  border: none;
+  border-radius: 8px;
+  padding: 6px 10px;
+  cursor: pointer;
+  font-size: 12px;
+}
+
 
 
 input {
@@ -974,6 +899,13 @@ input {
   </div>
 </div>
 
+<div class="card" id="breakdown" style="display:none;">
+  <div class="total-row"><span>カテゴリ別</span></div>
+  <div id="categoryBreakdown"></div>
+  <div class="total-row" style="margin-top:14px;"><span>日別</span></div>
+  <div id="dayBreakdown"></div>
+</div>
+
 <button class="scan-btn" onclick="toggleHistory()">利用確認</button>
 <div id="historyArea" style="display:none;"></div>
 
@@ -983,6 +915,7 @@ input {
 
 </div>
 
+<script src="{{ url_for('receipt_queue_js') }}"></script>
 <script>
 function goBudget() {
   document.getElementById("mainScreen").style.display = "none";
@@ -1133,26 +1066,261 @@ let totalBudget = 0;
 let used = 0;
 let historyData = [];
 
+// サーバーの台帳との同期
+// 台帳 ID は端末ごとに作って保存する（?ledger=ID で開くと別の端末の台帳を使う）
+// 追加・削除・予算変更は pendingChanges にためて、sync() で差分だけ送る。
+// cursor はサーバーから最後に受け取った変更の番号で、それより後の変更だけを受け取る。
+// 別の台帳に切り替えたとき、前の台帳に送っていない変更は outbox（台帳 ID ごと）に移し、前の台帳に送る。
+let ledgerId = null;
+let cursor = 0;
+let pendingChanges = [];
+let outbox = {};
+let syncing = false;
+
+function newId() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + Math.random().toString(36).slice(2, 12);
+}
+
+function initLedger() {
+  const fromUrl = new URLSearchParams(location.search).get("ledger");
+  ledgerId = fromUrl || localStorage.getItem("ledgerId") || newId();
+  if (ledgerId !== localStorage.getItem("ledgerId")) {
+    localStorage.setItem("ledgerId", ledgerId);
+    if (fromUrl) {
+      // 別の台帳に切り替えたときは最初から受け取り直す
+      cursor = 0;
+      olderBefore = null;
+      historyData = [];
+      used = 0;
+      totalBudget = 0;
+    }
+  }
+}
+
 // 保存
 function saveData() {
   localStorage.setItem("budgetData", JSON.stringify({
     totalBudget,
     used,
-    historyData
+    historyData,
+    cursor,
+    olderBefore,
+    pendingChanges,
+    pendingLedger: ledgerId,
+    outbox
   }));
 }
 
 // 復元
-function loadData() {
+async function loadData() {
   const data = JSON.parse(localStorage.getItem("budgetData"));
-  if (!data) return;
+  if (data) {
+    totalBudget = data.totalBudget || 0;
+    used = data.used || 0;
+    historyData = data.historyData || [];
+    cursor = data.cursor || 0;
+    olderBefore = data.olderBefore || null;
+    pendingChanges = data.pendingChanges || [];
+    outbox = data.outbox || {};
+  }
 
-  totalBudget = data.totalBudget || 0;
-  used = data.used || 0;
-  historyData = data.historyData || [];
+  const previousId = localStorage.getItem("ledgerId");
+  const previousCursor = cursor;
+  const previousHistory = historyData;
+  initLedger();
+  // この端末で使っていた台帳（?ledger= で初めて開いた端末にはない）
+  const fromUrl = new URLSearchParams(location.search).get("ledger");
+  const ownLedger = (data && data.pendingLedger) || previousId || (fromUrl ? null : ledgerId);
+  const changes = ownLedger ? pendingChanges : [];
+
+  // 台帳ができる前にこの端末で登録した分は、ID を付けてこの端末の台帳に送る
+  if (ownLedger) {
+    previousHistory.forEach((h) => {
+      if (!h.id) {
+        h.id = newId();
+        changes.push({ op: "add", id: h.id, amount: h.amount, category: h.category, date: h.date, time: h.time });
+      }
+    });
+  }
 
+  if (ownLedger && ownLedger !== ledgerId) {
+    // 別の台帳に切り替えたときは、未送信の変更を開いた台帳ではなく前の台帳に送る
+    if (changes.length) {
+      const box = outbox[ownLedger] || { cursor: previousCursor, changes: [] };
+      box.changes = box.changes.concat(changes);
+      outbox[ownLedger] = box;
+    }
+    pendingChanges = [];
+  } else {
+    pendingChanges = changes;
+  }
+  saveData();
+  if (!cursor && historyData.length === 0) {
+    await loadFirstHistoryPage();
+  }
   updateUI();
   renderHistory();
+  sync();
+}
+
+function queueChange(change) {
+  pendingChanges.push(change);
+  saveData();
+  sync();
+}
+
+// 切り替える前の台帳に残っていた変更を送る（返ってくる変更は開いている台帳のものではないので使わない）
+async function flushOutbox() {
+  for (const id of Object.keys(outbox)) {
+    const box = outbox[id];
+    while (box.changes.length > 0) {
+      const sending = box.changes.slice(0, 500);
+      const res = await fetch(`/api/ledgers/${encodeURIComponent(id)}/sync`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ since: box.cursor, changes: sending })
+      });
+      if (!res.ok) throw new Error(`sync failed: ${res.status}`);
+      box.cursor = (await res.json()).cursor;
+      box.changes = box.changes.slice(sending.length);
+      saveData();
+    }
+    delete outbox[id];
+    saveData();
+  }
+}
+
+// サーバーからの変更を反映する（自分が送った変更も戻ってくるので、反映済みなら何もしない）
+function applyChange(c) {
+  if (c.op === "add") {
+    if (historyData.some((h) => h.id === c.id)) return;
+    historyData.push({ id: c.id, date: c.date, time: c.time, category: c.category, amount: c.amount });
+    used += c.amount;
+  } else if (c.op === "delete") {
+    const index = historyData.findIndex((h) => h.id === c.id);
+    if (index === -1) {
+      // まだ読み込んでいない古い支出の削除は合計だけ減らす
+      if (olderBefore && c.amount) used = Math.max(0, used - c.amount);
+      return;
+    }
+    used -= historyData[index].amount;
+    if (used < 0) used = 0;
+    historyData.splice(index, 1);
+  } else if (c.op === "budget") {
+    totalBudget = c.amount;
+  }
+}
+
+async function sync() {
+  if (syncing || !ledgerId) return;
+  syncing = true;
+  let changed = false;
+  try {
+    await flushOutbox();
+    let more = true;
+    while (more) {
+      const sending = pendingChanges.slice(0, 500);
+      const res = await fetch(`/api/ledgers/${encodeURIComponent(ledgerId)}/sync`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ since: cursor, changes: sending })
+      });
+      if (!res.ok) throw new Error(`sync failed: ${res.status}`);
+      const data = await res.json();
+
+      // 送っている間に増えた変更は残す
+      pendingChanges = pendingChanges.slice(sending.length);
+      data.changes.forEach(applyChange);
+      changed = changed || sending.length > 0 || data.changes.length > 0;
+      cursor = data.cursor;
+      more = data.more || pendingChanges.length > 0;
+    }
+    updateUI();
+    renderHistory();
+    saveData();
+    if (changed || !ledgerSummary) await loadSummary();
+  } catch (e) {
+    // オフラインなどで失敗したときは次の同期で送り直す
+    console.error(e);
+  } finally {
+    syncing = false;
+  }
+}
+
+// 内訳（サーバーの集計をそのまま使う）
+const CATEGORY_COLORS = ["#ff8a2b", "#ffb347", "#e2572b", "#ffd29b", "#c9681f", "#f7a46b"];
+let ledgerSummary = null;
+
+async function loadSummary() {
+  try {
+    const res = await fetch(`/api/ledgers/${encodeURIComponent(ledgerId)}/summary`);
+    if (!res.ok) throw new Error(`summary failed: ${res.status}`);
+    ledgerSummary = await res.json();
+  } catch (e) {
+    console.error(e);
+    return;
+  }
+  // 未送信の変更がなければサーバーの合計に合わせる
+  if (pendingChanges.length === 0) {
+    used = ledgerSummary.used;
+    if (ledgerSummary.budget) totalBudget = ledgerSummary.budget;
+  }
+  updateUI();
+  renderBreakdown();
+}
+
+// 使った分をカテゴリごとの色で塗る（集計と手元の合計がずれているときは1色）
+function circleGradient(percent) {
+  if (!ledgerSummary || ledgerSummary.used !== used || !used) {
+    return `conic-gradient(#ff8a2b 0% ${percent}%, #f1e4d6 ${percent}% 100%)`;
+  }
+  const stops = [];
+  let start = 0;
+  ledgerSummary.categories.forEach((c, i) => {
+    const end = Math.min(percent, start + (c.amount / totalBudget) * 100);
+    stops.push(`${CATEGORY_COLORS[i % CATEGORY_COLORS.length]} ${start}% ${end}%`);
+    start = end;
+  });
+  stops.push(`#f1e4d6 ${percent}% 100%`);
+  return `conic-gradient(${stops.join(", ")})`;
+}
+
+function breakdownRow(label, amount, share, color) {
+  const row = document.createElement("div");
+  row.className = "breakdown-row";
+  const name = document.createElement("span");
+  name.textContent = label;
+  const value = document.createElement("span");
+  value.textContent = `¥${amount.toLocaleString()}`;
+  row.append(name, value);
+
+  const bar = document.createElement("div");
+  bar.className = "breakdown-bar";
+  const fill = document.createElement("div");
+  fill.style.width = `${Math.min(share * 100, 100)}%`;
+  fill.style.background = color;
+  bar.appendChild(fill);
+
+  const wrap = document.createElement("div");
+  wrap.append(row, bar);
+  return wrap;
+}
+
+function renderBreakdown() {
+  if (!ledgerSummary || ledgerSummary.count === 0) {
+    breakdown.style.display = "none";
+    return;
+  }
+  breakdown.style.display = "block";
+  const total = ledgerSummary.used || 1;
+  categoryBreakdown.replaceChildren(...ledgerSummary.categories.map((c, i) =>
+    breakdownRow(`${c.key}（${c.count}件）`, c.amount, c.amount / total, CATEGORY_COLORS[i % CATEGORY_COLORS.length])
+  ));
+  const maxDay = Math.max(...ledgerSummary.days.map((d) => d.amount), 1);
+  dayBreakdown.replaceChildren(...ledgerSummary.days.map((d) =>
+    breakdownRow(d.key, d.amount, d.amount / maxDay, "#ffb347")
+  ));
 }
 
 // UI更新
@@ -1172,8 +1340,7 @@ function updateUI() {
   budgetText.textContent = `¥${totalBudget.toLocaleString()}`;
   usedText.textContent = `${percent}% 使用済み`;
   barFill.style.width = percent + "%";
-  circle.style.background =
-    `conic-gradient(#ff8a2b 0% ${percent}%, #f1e4d6 ${percent}% 100%)`;
+  circle.style.background = circleGradient(Number(percent));
 }
 
 // 円グラフのみリセット
@@ -1188,40 +1355,134 @@ function resetCircleOnly() {
 function toggleHistory() {
   historyArea.style.display =
     historyArea.style.display === "none" ? "block" : "none";
+  renderHistory();
 }
 
-// 履歴描画
-function renderHistory() {
-  historyArea.innerHTML = "";
-
-  historyData.forEach((h, index) => {
-    const div = document.createElement("div");
-    div.className = "item";
-
-    div.innerHTML = `
-      <div style="display:flex; justify-content:space-between; align-items:center;">
-        <div>
-          <div>${h.date} ${h.time}</div>
-          <div>🧾 ${h.category}</div>
-          <div>¥${h.amount.toLocaleString()}</div>
-        </div>
-        <button onclick="deleteHistory(${index})"
-          style="
-            background:#ff6b6b;
-            color:#fff;
-            border:none;
-            border-radius:8px;
-            padding:6px 10px;
-            cursor:pointer;
-            font-size:12px;
-          ">
-          削除
-        </button>
-      </div>
-    `;
+// 履歴描画（新しい順）
+// 行の高さを固定し、見えている範囲（前後 HISTORY_OVERSCAN 行を含む）の行だけを DOM に置く。
+// 行は支出の ID ごとに使い回すので、追加・削除のたびに作り直すのはその行だけになる。
+const HISTORY_ROW_HEIGHT = 96;
+const HISTORY_OVERSCAN = 6;
+const HISTORY_PAGE_SIZE = 100;
+const historyRows = new Map();
+let historySpacer = null;
+// サーバーにまだ読み込んでいない古い履歴があるとき、その続きの位置（seq）
+let olderBefore = null;
+let loadingOlder = false;
 
-    historyArea.appendChild(div);
+function historyAt(i) {
+  return historyData[historyData.length - 1 - i];
+}
+
+function createHistoryRow(h) {
+  const div = document.createElement("div");
+  div.className = "item history-row";
+
+  const info = document.createElement("div");
+  const when = document.createElement("div");
+  when.textContent = `${h.date} ${h.time}`;
+  const category = document.createElement("div");
+  category.textContent = `🧾 ${h.category}`;
+  const amount = document.createElement("div");
+  amount.textContent = `¥${h.amount.toLocaleString()}`;
+  info.append(when, category, amount);
+
+  const button = document.createElement("button");
+  button.className = "history-delete";
+  button.textContent = "削除";
+  button.addEventListener("click", () => deleteHistory(h.id));
+
+  div.append(info, button);
+  return div;
+}
+
+function renderHistory() {
+  if (!historySpacer) {
+    historySpacer = document.createElement("div");
+    historySpacer.className = "history-spacer";
+    historyArea.appendChild(historySpacer);
+    historyArea.addEventListener("scroll", () => {
+      renderHistory();
+      loadOlderHistory();
+    }, { passive: true });
+  }
+  if (historyArea.style.display === "none") return;
+
+  const count = historyData.length;
+  historySpacer.style.height = `${count * HISTORY_ROW_HEIGHT}px`;
+
+  const first = Math.max(0, Math.floor(historyArea.scrollTop / HISTORY_ROW_HEIGHT) - HISTORY_OVERSCAN);
+  const rows = Math.ceil((historyArea.clientHeight || 600) / HISTORY_ROW_HEIGHT) + HISTORY_OVERSCAN * 2;
+  const last = Math.min(count, first + rows);
+
+  const visible = new Set();
+  for (let i = first; i < last; i++) {
+    const h = historyAt(i);
+    visible.add(h.id);
+    let row = historyRows.get(h.id);
+    if (!row) {
+      row = createHistoryRow(h);
+      historyRows.set(h.id, row);
+      historySpacer.appendChild(row);
+    }
+    const top = `${i * HISTORY_ROW_HEIGHT}px`;
+    if (row.style.top !== top) row.style.top = top;
+  }
+  historyRows.forEach((row, id) => {
+    if (!visible.has(id)) {
+      row.remove();
+      historyRows.delete(id);
+    }
   });
+  loadOlderHistory();
+}
+
+async function fetchHistoryPage(before) {
+  const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+  if (before) params.set("before", before);
+  const res = await fetch(`/api/ledgers/${encodeURIComponent(ledgerId)}/entries?${params}`);
+  if (!res.ok) throw new Error(`history failed: ${res.status}`);
+  return res.json();
+}
+
+// 初めて開く端末では、全履歴ではなく最新の1ページと合計だけをもらう
+async function loadFirstHistoryPage() {
+  try {
+    const data = await fetchHistoryPage(null);
+    historyData = data.entries.reverse().map(toHistoryItem);
+    totalBudget = data.budget;
+    used = data.used;
+    cursor = data.cursor;
+    olderBefore = data.next_before;
+  } catch (e) {
+    console.error(e);
+  }
+}
+
+// 一番下の近くまでスクロールしたら、古い履歴の続きを読む
+async function loadOlderHistory() {
+  if (!olderBefore || loadingOlder || historyArea.style.display === "none") return;
+  const bottom = historyArea.scrollTop + (historyArea.clientHeight || 600);
+  if (bottom < historyData.length * HISTORY_ROW_HEIGHT - HISTORY_ROW_HEIGHT * 10) return;
+
+  loadingOlder = true;
+  try {
+    const data = await fetchHistoryPage(olderBefore);
+    const known = new Set(historyData.map((h) => h.id));
+    const older = data.entries.reverse().map(toHistoryItem).filter((h) => !known.has(h.id));
+    historyData = older.concat(historyData);
+    olderBefore = data.next_before;
+    renderHistory();
+    saveData();
+  } catch (e) {
+    console.error(e);
+  } finally {
+    loadingOlder = false;
+  }
+}
+
+function toHistoryItem(e) {
+  return { id: e.id, date: e.date, time: e.time, category: e.category, amount: e.amount };
 }
 
 
@@ -1230,33 +1491,149 @@ function openCamera() {
   cameraInput.click();
 }
 
+// 送る前に Web Worker で縮小・再エンコードする（EXIF も消える）。使えないブラウザでは元の画像のまま送る
+let imageWorker = null;
+let imageJobId = 0;
+const imageJobs = new Map();
+
+function getImageWorker() {
+  if (imageWorker === null) {
+    try {
+      imageWorker = new Worker("{{ url_for('receipt_image_worker_js') }}");
+      imageWorker.onmessage = (event) => {
+        const job = imageJobs.get(event.data.id);
+        if (!job) return;
+        imageJobs.delete(event.data.id);
+        if (event.data.error) job.reject(new Error(event.data.error));
+        else job.resolve(event.data.blob);
+      };
+    } catch (e) {
+      imageWorker = false;
+    }
+  }
+  return imageWorker;
+}
+
+async function compressReceiptImage(file) {
+  const worker = typeof OffscreenCanvas !== "undefined" && getImageWorker();
+  if (!worker || !file) return file;
+  try {
+    const blob = await new Promise((resolve, reject) => {
+      const id = ++imageJobId;
+      imageJobs.set(id, { resolve, reject });
+      worker.postMessage({ id, file });
+    });
+    return blob;
+  } catch (e) {
+    console.error(e);
+    return file;
+  }
+}
+
 async function analyzeImage(file) {
+  if (!file) return;
+  cameraInput.value = "";
+  file = await compressReceiptImage(file);
+
+  // 電波がないときは最初からキューに入れる
+  if (!navigator.onLine) {
+    await queueReceiptForLater(file);
+    return;
+  }
   try {
     const formData = new FormData();
-    formData.append("image", file);
+    formData.append("image", file, "receipt");
 
     const res = await fetch("/analyze_receipt", {
       method: "POST",
       body: formData
     });
-
-    const data = await res.json();
-    const amount = Number(data.text.replace(/[^\d]/g, ""));
-
-    if (!amount) {
-      alert("金額を読み取れませんでした");
+    if (res.status === 413) {
+      alert("画像が大きすぎます");
       return;
     }
+    if (!res.ok) throw new Error(`analyze_receipt failed: ${res.status}`);
 
-    expenseInput.value = amount;
-    categoryInput.value = "レシート読み取り";
-    addExpense();
+    applyReceipt(await res.json());
+  } catch (e) {
+    console.error(e);
+    await queueReceiptForLater(file);
+  }
+}
+
+// これより自信がない読み取り結果は、登録する前に確認する
+const RECEIPT_MIN_CONFIDENCE = 0.6;
+
+// data: /analyze_receipt の結果 { amount, currency, confidence, line, amount_jpy, rate }
+function applyReceipt(data) {
+  if (!data || !data.amount) {
+    alert("金額を読み取れませんでした");
+    return;
+  }
+  const foreign = data.currency !== "JPY";
+  const amount = Math.round(Number(data.amount_jpy ?? (foreign ? NaN : data.amount)));
+  if (!amount) {
+    alert(`${data.currency} の換算レートがないため登録できませんでした（${data.amount} ${data.currency}）`);
+    return;
+  }
+  if (foreign || data.confidence < RECEIPT_MIN_CONFIDENCE) {
+    const read = foreign
+      ? `${data.amount.toLocaleString()} ${data.currency}（1 ${data.currency} = ¥${data.rate.toPrecision(4)}）`
+      : `¥${amount.toLocaleString()}`;
+    if (!confirm(`「${data.line}」から ${read} と読み取りました。¥${amount.toLocaleString()} として登録しますか？`)) return;
+  }
+
+  expenseInput.value = amount;
+  categoryInput.value = "レシート読み取り";
+  addExpense();
+}
+
+// 送れなかったレシートは端末に保存し、つながったら Service Worker が送る
+async function queueReceiptForLater(file) {
+  try {
+    await queueReceipt(file);
+    await requestReceiptSync();
+    alert("通信できないため、レシートを保存しました。つながったら自動で読み取って登録します");
   } catch (e) {
     console.error(e);
     alert("解析に失敗しました");
   }
 }
 
+async function requestReceiptSync() {
+  if (!("serviceWorker" in navigator)) {
+    // Service Worker が使えないブラウザでは画面から直接送る
+    if (navigator.onLine) flushReceiptQueue().catch(console.error).finally(recordReceiptResults);
+    return;
+  }
+  const registration = await navigator.serviceWorker.ready;
+  if ("sync" in registration) {
+    await registration.sync.register(RECEIPT_SYNC_TAG);
+  } else if (registration.active && navigator.onLine) {
+    registration.active.postMessage({ type: "flush-receipts" });
+  }
+}
+
+// 後から届いた読み取り結果を登録する
+async function recordReceiptResults() {
+  try {
+    const results = await takeReceiptResults();
+    results.forEach((r) => applyReceipt(r.data));
+  } catch (e) {
+    console.error(e);
+  }
+}
+
+if ("serviceWorker" in navigator) {
+  navigator.serviceWorker.register("/sw.js").catch(console.error);
+  navigator.serviceWorker.addEventListener("message", (event) => {
+    if (event.data && event.data.type === "receipt-results") recordReceiptResults();
+  });
+}
+window.addEventListener("online", () => {
+  receiptQueueSize().then((n) => { if (n) requestReceiptSync(); }).catch(console.error);
+});
+
 
 
 
@@ -1266,23 +1643,31 @@ async function analyzeImage(file) {
 
 // 金額登録
 function addExpense() {
-  if (budgetInput.value > 0) totalBudget = Number(budgetInput.value);
+  const budget = Number(budgetInput.value);
+  if (budget > 0 && budget !== totalBudget) {
+    totalBudget = budget;
+    queueChange({ op: "budget", id: newId(), amount: totalBudget });
+  }
   const expense = Number(expenseInput.value);
   if (!expense || !totalBudget) return;
 
   used += expense;
 
   const now = new Date();
-  historyData.push({
+  const pad = (n) => String(n).padStart(2, "0");
+  const day = `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())}`;
+  const entry = {
+    id: newId(),
     date: now.toLocaleDateString(),
     time: now.toLocaleTimeString(),
     category: categoryInput.value || "未分類",
     amount: expense
-  });
+  };
+  historyData.push(entry);
 
   updateUI();
   renderHistory();
-  saveData();
+  queueChange({ op: "add", day, ...entry });
 
   expenseInput.value = "";
   categoryInput.value = "";
@@ -1291,32 +1676,33 @@ function addExpense() {
 
 
 
-let deleteTargetIndex = null;
+let deleteTargetId = null;
 
-function deleteHistory(index) {
-  deleteTargetIndex = index;
+function deleteHistory(id) {
+  deleteTargetId = id;
   document.getElementById("deleteModal").style.display = "flex";
 }
 
 function closeDeleteModal() {
-  deleteTargetIndex = null;
+  deleteTargetId = null;
   document.getElementById("deleteModal").style.display = "none";
 }
 
 function confirmDelete() {
-  if (deleteTargetIndex === null) return;
+  if (deleteTargetId === null) return;
 
-  const target = historyData[deleteTargetIndex];
-  if (!target) return;
+  const index = historyData.findIndex((h) => h.id === deleteTargetId);
+  if (index === -1) return;
+  const target = historyData[index];
 
   used -= target.amount;
   if (used < 0) used = 0;
 
-  historyData.splice(deleteTargetIndex, 1);
+  historyData.splice(index, 1);
 
   updateUI();
   renderHistory();
-  saveData();
+  queueChange({ op: "delete", id: target.id });
 
   closeDeleteModal();
 }
@@ -1326,7 +1712,20 @@ function confirmDelete() {
 
 
 // 初期化
-document.addEventListener("DOMContentLoaded", loadData);
+document.addEventListener("DOMContentLoaded", () => {
+  loadData().then(() => {
+    recordReceiptResults();
+    if (navigator.onLine) {
+      receiptQueueSize().then((n) => { if (n) requestReceiptSync(); }).catch(console.error);
+    }
+  });
+});
+// 別の端末での変更を取り込む
+setInterval(sync, 30000);
+window.addEventListener("online", sync);
+document.addEventListener("visibilitychange", () => {
+  if (document.visibilityState === "visible") sync();
+});
 
 
 
@@ -1470,181 +1869,81 @@ TRIP_BLOCK = r"""
 
 </form>
 
+<div id="tripResult">
 {% if trip %}
-<hr style="margin:40px 0; border:none; border-top:1px solid #ddd;">
-<h2 style="text-align:center;">{{ destination }} {{ days }}日プラン</h2>
-
-{% for d in trip %}
-  <div class="result-card">
-    <h3>Day {{ d.day }}</h3>
-    {% for s in d.schedule %}
-      <p style="margin:12px 0;">
-        <b>{{ s.time }}</b> {{ s.title }}<br>
-        {{ s.detail }}<br>
-        <span style="color:#6b7a8c; font-size:0.9rem;">Tips: {{ s.tips }}</span>
-      </p>
-    {% endfor %}
-  </div>
+{{ trip_header }}
+{% for card in day_cards %}
+{{ card }}
 {% endfor %}
+{% elif restore_url %}
+<p class="sub"><a id="tripRestore" href="{{ restore_url }}">前回の旅行プランを表示する</a></p>
 {% endif %}
+</div>
 
-<hr style="margin:40px 0; border:none; border-top:1px solid #ddd;">
-"""
-@app.route("/", methods=["GET", "POST"])
-def index():
-    trip = session.get("trip")
-    destination = session.get("destination")
-    days = session.get("days", 3)
-    style = session.get("style", "王道観光")
-    souvenirs = session.get("souvenirs", [])
-
-
-    if request.method == "POST":
-
-        
-        if "trip_submit" in request.form:
-            destination = request.form.get("destination")
-            days = int(request.form.get("days", 3))
-            style = request.form.get("style", "王道観光")
-            trip = build_trip(destination, days, style)
-
-            session["trip"] = trip
-            session["destination"] = destination
-            session["days"] = days
-            session["style"] = style
-
-        if "souvenir_submit" in request.form:
-            place = request.form.get("place")
-            target = request.form.get("target")
-            budget = request.form.get("budget")
-            genre = request.form.get("genre")
-            shelf = request.form.get("shelf")
-            package = request.form.get("package")
-            allergy = request.form.get("allergy")
-
-            prompt = f"""
-あなたは日本のお土産に詳しい専門家です。
-
-【条件】
-旅行先:{place}
-誰向け:{target}
-予算:{budget}
-ジャンル：{genre}
-日持ち：{shelf}
-個包装：{package}
-アレルギー配慮：{allergy}
-
-【ルール】
-条件に合う「日本の伝統的・一般的なお土産」を選び、
-**Wikipediaに単独ページがある名称のみ**を使って、
-以下の形式で書いてください。
-- 「ジャンル」が「食べ物」以外の場合は、日持ち・アレルギー条件は無視してください
-- 任意項目が空欄または「気にしない」の場合は考慮しなくて構いません
-- 予算内で現実的に購入できるものを選んでください
-- 日本の一般的・伝統的なお土産に限定してください
-- Wikipediaに単独ページが存在する名称のみを使用してください
-- Wikipediaに単独ページが存在するという内容は書かないでください。
-- 敬語で書いてください
-- 一つのお土産に対して4行以上の文章で書いてください。
-- どこで売っているかも書いてください。
-
-【出力形式】
-以下の形式で4つ提案してください。
-
-1. お土産名：条件に合っている理由が分かる説明
-2. お土産名：条件に合っている理由が分かる説明
-3. お土産名：条件に合っている理由が分かる説明
-4. お土産名：条件に合っている理由が分かる説明
-"""
-
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-
-            text = response.choices[0].message.content
-
-            souvenirs = []   # ← ここで必ずリセット
-
-            for line in text.split("\n"):
-                line = line.strip()
-
-                # 「1. 〇〇：」「2. 〇〇：」だけ拾う
-                if re.match(r"^[1-6]\.\s*.+：", line):
-                    name, desc = line.split("：", 1)
-                    clean_name = re.sub(r"^[1-6]\.\s*", "", name).strip()
-                    clean_name = clean_name.replace("（", "").replace("）", "")
-
-                    image_url = get_wikipedia_image(clean_name)
-
-                    souvenirs.append({
-                        "name": clean_name,
-                        "description": desc.strip(),
-                        "image": image_url
-                    })
-
-            # 念のため6件に制限
-            souvenirs = souvenirs[:6]
-
-            session["souvenirs"] = souvenirs
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    return render_template_string(
-        INDEX_HTML,
-        trip_block=Markup(
-            render_template_string(
-                TRIP_BLOCK,
-                trip=trip,
-                destination=destination,
-                days=days,
-                style=style
-            )
-        ),
-        souvenirs=souvenirs,
-        form=request.form,
-        destination=destination,
-        days=days,
-        style=style
-    )
+<script>
+// 旅行プランを1日ずつ表示する（/trip/stream の Server-Sent Events を受け取る）
+(function () {
+  const tripForm = document.getElementById("tripBtn").closest("form");
+  const tripResult = document.getElementById("tripResult");
+  const restoreLink = document.getElementById("tripRestore");
+  if (!window.EventSource) return;
+
+  function streamTrip(params, onFail) {
+    tripResult.innerHTML = "";
+
+    const source = new EventSource("{{ url_for('trip_stream') }}?" + params.toString());
+    let received = false;
+    source.addEventListener("plan", (ev) => {
+      tripResult.insertAdjacentHTML("beforeend", JSON.parse(ev.data).html);
+    });
+    source.addEventListener("day", (ev) => {
+      received = true;
+      tripResult.insertAdjacentHTML("beforeend", JSON.parse(ev.data).html);
+    });
+    source.addEventListener("done", (ev) => {
+      source.close();
+      history.replaceState(null, "", JSON.parse(ev.data).share_url);
+    });
+    source.onerror = () => {
+      source.close();
+      if (!received) onFail();
+    };
+  }
 
-    
-@app.route("/analyze_receipt", methods=["POST"])
-def analyze_receipt():
-    file = request.files["image"]
-    image_bytes = file.read()
-    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+  tripForm.addEventListener("submit", (e) => {
+    e.preventDefault();
+    streamTrip(new URLSearchParams(new FormData(tripForm)), () => {
+      // ストリームが使えないときは通常の送信に戻す
+      const hidden = document.createElement("input");
+      hidden.type = "hidden";
+      hidden.name = "trip_submit";
+      tripForm.appendChild(hidden);
+      tripForm.submit();
+    });
+  });
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "このレシート画像から、「合計」「お支払額」「ご請求額」「TOTAL」と書かれている行を探してください。その中で支払った「税込の合計金額」だけを1つ抽出して数字のみで返してください。文章や記号、通貨表記は不要です。小計、税抜金額、内税、消費税額、ポイント利用額、預かり金、釣り銭は無視してください。"},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-            ]
-        }],
-        max_tokens=50
-    )
+  // 前回のプランが作成済みでなければ、画面を出してから1日ずつ読み込む（失敗したらリンクを残す）
+  if (restoreLink) {
+    streamTrip(new URL(restoreLink.href, location.href).searchParams, () => {
+      tripResult.replaceChildren(restoreLink);
+    });
+  }
+})();
+</script>
 
-    text = response.choices[0].message.content
-    return {"text": text}
+<hr style="margin:40px 0; border:none; border-top:1px solid #ddd;">
+"""
 
 
+app = factory.create_app(__name__, INDEX_HTML, TRIP_BLOCK, souvenir_count=4, remember=True)
+app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+ledger.init_app(app)
+offline.init_app(app)
+receipts.init_app(app)
 
 
 if __name__ == "__main__":
+    # リローダーの親プロセスはリクエストを受けないので、実際に動く子プロセスだけ温める
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        clients.warmup(app)
     app.run(debug=True)
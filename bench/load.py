@@ -0,0 +1,227 @@
+#エンドツーエンドの負荷テスト
+#
+# スタブの Wikipedia / OpenAI を立ち上げ、app.py か app2.py をローカルで起動して
+# "/"（お土産）、旅行プラン、"/analyze_receipt" にリクエストを流す。
+#
+#   python -m bench.load --app app2 --scenarios souvenir,trip,receipt \
+#       --concurrency 8 --requests 200 --json bench/result.json
+#   python -m bench.load --app app2 --baseline bench/result.json
+#
+# 遅延は "中央値ms:sigma:エラー率" で指定する（例: --wiki-latency 80:0.6:0.01）。
+# スポット説明文・家計簿・為替レートのファイルは一時ディレクトリに作る（手元のファイルを汚さず、毎回キャッシュなしから測る）。
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from bench.stubs import LatencyModel, start_openai_stub, start_wikipedia_stub, use_temp_files
+
+
+SOUVENIR_FORM = {
+    "place": "京都府",
+    "target": "家族",
+    "budget": "〜2000円",
+    "genre": "お菓子",
+    "shelf": "7日以上",
+    "package": "個包装がいい",
+    "allergy": "気にしない",
+    "souvenir_submit": "1",
+}
+
+TRIP_FORM = {
+    "destination": "京都",
+    "days": "3",
+    "style": "王道観光",
+    "trip_submit": "1",
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class Scenario:
+    def __init__(self, name, method, path, data=None, files=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.files = files
+
+    def send(self, session, base_url):
+        files = None
+        if self.files is not None:
+            files = {k: (fname, body, ctype) for k, (fname, body, ctype) in self.files.items()}
+        return session.request(self.method, base_url + self.path, data=self.data, files=files, timeout=120)
+
+
+def build_scenarios(names, image_kb, seed):
+    rng = random.Random(seed)
+    image = rng.randbytes(image_kb * 1024)
+    table = {
+        "index": Scenario("index", "GET", "/"),
+        "souvenir": Scenario("souvenir", "POST", "/", data=SOUVENIR_FORM),
+        "trip": Scenario("trip", "POST", "/", data=TRIP_FORM),
+        "receipt": Scenario("receipt", "POST", "/analyze_receipt",
+                            files={"image": ("receipt.jpg", image, "image/jpeg")}),
+    }
+    return [table[n] for n in names]
+
+
+def start_app(module_name):
+    module = importlib.import_module(module_name)
+    server = make_server("127.0.0.1", 0, module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_load(base_url, scenarios, concurrency, total):
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            scenario = scenarios[i % len(scenarios)]
+            start = time.perf_counter()
+            try:
+                status = scenario.send(session, base_url).status_code
+            except requests.RequestException:
+                status = 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                results.append((scenario.name, elapsed, status))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall, upstream_calls):
+    report = {"wall_seconds": round(wall, 3), "scenarios": {}, "upstream_calls": upstream_calls}
+    names = sorted({r[0] for r in results})
+    for name in names + ["all"]:
+        rows = [r for r in results if name == "all" or r[0] == name]
+        latencies = sorted(r[1] for r in rows)
+        errors = sum(1 for r in rows if not 200 <= r[2] < 400)
+        report["scenarios"][name] = {
+            "requests": len(rows),
+            "errors": errors,
+            "throughput_rps": round(len(rows) / wall, 2) if wall > 0 else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+    total = report["scenarios"]["all"]["requests"] or 1
+    report["upstream_calls_per_request"] = {
+        k: round(v / total, 2) for k, v in sorted(upstream_calls.items())
+    }
+    return report
+
+
+def _delta(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_report(report, baseline=None):
+    base = (baseline or {}).get("scenarios", {})
+    print(f"{'scenario':<10} {'req':>5} {'err':>4} {'rps':>14} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    for name, s in report["scenarios"].items():
+        b = base.get(name, {})
+        print(
+            f"{name:<10} {s['requests']:>5} {s['errors']:>4} "
+            f"{s['throughput_rps']:>6}{_delta(s['throughput_rps'], b.get('throughput_rps')):<8} "
+            f"{s['p50_ms']:>9}{_delta(s['p50_ms'], b.get('p50_ms')):<9} "
+            f"{s['p95_ms']:>9}{_delta(s['p95_ms'], b.get('p95_ms')):<9} "
+            f"{s['p99_ms']:>9}{_delta(s['p99_ms'], b.get('p99_ms')):<9}"
+        )
+    print("upstream calls:")
+    old_calls = (baseline or {}).get("upstream_calls", {})
+    for name, count in sorted(report["upstream_calls"].items()):
+        print(f"  {name:<28} {count:>6}{_delta(count, old_calls.get(name))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="app.py / app2.py の負荷テスト")
+    parser.add_argument("--app", default="app2", help="起動するモジュール（app / app2）")
+    parser.add_argument("--scenarios", default="souvenir,trip,receipt")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--wiki-latency", default="80:0.6:0.0")
+    parser.add_argument("--openai-latency", default="800:0.4:0.0")
+    parser.add_argument("--image-kb", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    parser.add_argument("--baseline", help="比較する過去の結果 JSON")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    if args.app == "app" and "receipt" in names:
+        names.remove("receipt")
+
+    wiki = start_wikipedia_stub(LatencyModel.parse(args.wiki_latency, seed=args.seed))
+    openai_stub = start_openai_stub(LatencyModel.parse(args.openai_latency, seed=args.seed + 1))
+    os.environ["WIKI_ENDPOINT"] = wiki.url + "/w/api.php"
+    os.environ["OPENAI_BASE_URL"] = openai_stub.url + "/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    tmp = use_temp_files(prefix="bench-load-")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server, base_url = start_app(args.app)
+    scenarios = build_scenarios(names, args.image_kb, args.seed)
+    try:
+        if args.warmup:
+            run_load(base_url, scenarios, min(args.concurrency, args.warmup), args.warmup)
+        wiki.reset_counts()
+        openai_stub.reset_counts()
+
+        results, wall = run_load(base_url, scenarios, args.concurrency, args.requests)
+        upstream_calls = {f"wikipedia.{k}": v for k, v in wiki.calls.items()}
+        upstream_calls.update({f"openai.{k}": v for k, v in openai_stub.calls.items()})
+        report = summarize(results, wall, upstream_calls)
+        report["config"] = vars(args)
+    finally:
+        server.shutdown()
+        wiki.stop()
+        openai_stub.stop()
+        tmp.cleanup()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,233 @@
+#CPU 側のマイクロベンチマーク
+#
+# ネットワークを使わずに build_trip / お土産回答のパース / テンプレート描画を計測する。
+# pytest-benchmark と同じく min / median / mean / stddev を出す。
+# --baseline を渡したときだけ、そのファイルより median が閾値以上遅くなったら終了コード 1 を返す
+# （時間はマシンによって違うので、ベースラインはリポジトリに置かず、比べるマシンで作る）。
+#
+#   python -m bench.micro --save micro.json                       # 結果をベースラインとして保存
+#   python -m bench.micro --baseline micro.json --threshold 0.2   # 比較（20% 以上遅いと失敗）
+import argparse
+import importlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from flask import render_template_string, request
+from markupsafe import Markup
+
+from bench.stubs import stub_lat, stub_lon, title_hash, use_temp_files
+
+
+#実際の gpt-4.1-mini の回答に近い形（説明が複数行にわたる、前置きや締めの文がある）
+SOUVENIR_COMPLETION = """ご希望の条件に合うお土産を6つご提案いたします。
+
+1. 八ツ橋：京都を代表する銘菓で、米粉と砂糖、ニッキを使った焼き菓子でございます。
+個包装の商品も多く、職場の方へのお配りにも適しております。
+日持ちも比較的長く、常温で保存いただけます。
+京都駅構内のお土産売り場や四条通りの老舗店舗でお求めいただけます。
+2. 生八ツ橋：もちもちとした食感の生地で餡を包んだ和菓子でございます。
+抹茶やニッキなど味の種類が豊富で、ご家族で楽しんでいただけます。
+日持ちは1週間程度のものが多いため、お早めにお召し上がりください。
+京都駅や清水寺周辺の各店舗で販売されております。
+3. 阿闍梨餅：しっとりとした餅生地で粒餡を包んだ京都の銘菓でございます。
+一つずつ個包装されており、ご予算内で購入いただけます。
+本店のほか、百貨店の和菓子売り場でもお求めいただけます。
+大変人気のため、午前中のご購入をおすすめいたします。
+4. 千枚漬け：聖護院かぶを薄く切って昆布と漬けた京漬物でございます。
+ご飯のお供としてご家族にも喜ばれる一品でございます。
+冷蔵保存が必要なため、お持ち帰りの時間にご注意ください。
+錦市場や京都駅の漬物店でお求めいただけます。
+5. 宇治茶：京都府南部の宇治周辺で生産される日本茶でございます。
+ティーバッグの商品であれば手軽にお楽しみいただけます。
+日持ちが長く、常温で保存いただけるため贈り物にも最適でございます。
+宇治の茶舗や京都駅のお土産売り場で販売されております。
+6. 京飴：色とりどりの見た目が美しい京都の飴でございます。
+小分けになった商品が多く、お子様にも喜ばれます。
+長期間保存いただけるため、日持ちを気にされる方にもおすすめです。
+祇園や嵐山の飴専門店でお求めいただけます。
+
+以上、ご参考になれば幸いでございます。
+"""
+
+SOUVENIR_FORM = {
+    "place": "京都府",
+    "target": "家族",
+    "budget": "〜2000円",
+    "genre": "お菓子",
+    "shelf": "7日以上",
+    "package": "個包装がいい",
+    "allergy": "気にしない",
+}
+
+
+def stub_search(query, limit=10):
+    return [f"{query} スポット{i}" for i in range(limit)]
+
+
+def stub_page_features(titles):
+    features = {}
+    for title in titles:
+        h = title_hash(title)
+        features[title] = {
+            "coords": (stub_lat(h), stub_lon(h)) if h % 10 else None,
+            "image": bool(h % 4),
+        }
+    return features
+
+
+# アプリのモジュールは use_temp_files のあとで import する（import 時にファイルの場所を読むため）
+def load_app(name):
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    import enrich
+    import wiki
+
+    module = importlib.import_module(name)
+    wiki.search_titles = stub_search
+    wiki.get_page_features = stub_page_features
+    module.app.extensions["trips"].descriptions = enrich.DescriptionStore(
+        generate=lambda titles, destination: {t: f"{t}の説明" for t in titles}, path=None
+    )
+    return module
+
+
+def make_benchmarks(module):
+    import factory
+    import scoring
+
+    benches = {}
+    trips = module.app.extensions["trips"]
+    souvenirs = module.app.extensions["souvenirs"]
+
+    for days in range(1, 8):
+        def bench_trip(days=days):
+            trips.build_trip("京都", days, "王道観光")
+        benches[f"build_trip[{days}d]"] = bench_trip
+
+    titles = [f"京都 {w}{i}" for i in range(1000) for w in ("寺", "神社", "市場", "公園", "美術館")]
+    features = stub_page_features(titles)
+    popularity = [title_hash(t) % 10000 for t in titles]
+
+    def bench_rank():
+        scoring.rank(titles, "写真映え", 35, features=features, popularity=popularity)
+    benches["scoring.rank[5000]"] = bench_rank
+
+    def bench_parse():
+        souvenirs.parse(SOUVENIR_COMPLETION)
+    benches["parse_souvenirs"] = bench_parse
+
+    random.seed(0)
+    trip = trips.build_trip("京都", 7, "王道観光")
+    items = [
+        {"name": name, "description": desc, "image": f"https://upload.example.invalid/{i}.jpg"}
+        for i, (name, desc) in enumerate(souvenirs.parse(SOUVENIR_COMPLETION))
+    ]
+
+    def bench_render():
+        with module.app.test_request_context("/", method="POST", data=SOUVENIR_FORM):
+            trip_block = Markup(render_template_string(
+                module.TRIP_BLOCK, trip=trip, destination="京都", days=7, style="王道観光",
+                trip_header=factory.render_trip_header("京都", 7, None),
+                day_cards=[factory.render_day_card(d) for d in trip],
+            ))
+            render_template_string(
+                module.INDEX_HTML,
+                trip_block=trip_block,
+                souvenirs=items,
+                form=request.form,
+                destination="京都",
+                days=7,
+                style="王道観光",
+            )
+    benches["render_index[7d+souvenirs]"] = bench_render
+
+    return benches
+
+
+def measure(func, rounds, min_round_time=0.005):
+    # 1ラウンドが min_round_time 以上になるよう反復回数を決める
+    func()
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        if time.perf_counter() - start >= min_round_time:
+            break
+        iterations *= 2
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - start) / iterations)
+
+    return {
+        "min_us": round(min(samples) * 1e6, 3),
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "mean_us": round(statistics.mean(samples) * 1e6, 3),
+        "stddev_us": round(statistics.pstdev(samples) * 1e6, 3),
+        "rounds": rounds,
+        "iterations": iterations,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="build_trip / パース / 描画のマイクロベンチマーク")
+    parser.add_argument("--app", default="app2")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--filter", default="", help="名前にこの文字列を含むものだけ実行")
+    parser.add_argument("--baseline", help="比較するベースライン JSON")
+    parser.add_argument("--save", help="結果をベースラインとして保存するパス（app ごとに追記）")
+    parser.add_argument("--threshold", type=float, default=0.2, help="許容する median の悪化率")
+    args = parser.parse_args(argv)
+
+    # ベンチ中にアプリが作るファイル（家計簿の DB など）は一時ディレクトリに置く
+    with use_temp_files(prefix="bench-micro-"):
+        module = load_app(args.app)
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f).get(args.app, {})
+
+        results = {}
+        regressions = []
+        print(f"{'benchmark':<28} {'min us':>10} {'median us':>10} {'mean us':>10} {'stddev':>9}  vs baseline")
+        for name, func in make_benchmarks(module).items():
+            if args.filter not in name:
+                continue
+            random.seed(0)
+            r = results[name] = measure(func, args.rounds)
+            note = ""
+            old = baseline.get(name)
+            if old:
+                change = (r["median_us"] - old["median_us"]) / old["median_us"]
+                note = f"{change * 100:+.1f}%"
+                if change > args.threshold:
+                    regressions.append(name)
+                    note += "  REGRESSION"
+            print(f"{name:<28} {r['min_us']:>10} {r['median_us']:>10} {r['mean_us']:>10} {r['stddev_us']:>9}  {note}")
+
+        if args.save:
+            stored = {}
+            if os.path.exists(args.save):
+                with open(args.save, encoding="utf-8") as f:
+                    stored = json.load(f)
+            stored[args.app] = results
+            with open(args.save, "w", encoding="utf-8") as f:
+                json.dump(stored, f, ensure_ascii=False, indent=2)
+            print(f"baseline saved: {args.save}")
+
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+            return 1
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
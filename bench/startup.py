@@ -0,0 +1,114 @@
+#起動時間のベンチマーク
+#
+# 毎回新しいプロセスで app.py / app2.py を import し、
+#   import にかかる時間 → （--warmup なら clients.warmup）→ 最初のリクエスト → 2回目のリクエスト
+# の時間を測る。リクエストはスタブの Wikipedia / OpenAI に向けたお土産検索（POST /）。
+# 自動スケールで増えたワーカーが最初のリクエストを返すまでの時間を見るためのもの。
+#
+#   python -m bench.startup --app app2 --runs 5
+#   python -m bench.startup --app app --modes cold,warmup --json bench/startup.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.load import SOUVENIR_FORM
+from bench.stubs import LatencyModel, start_openai_stub, start_wikipedia_stub, use_temp_files
+
+
+def child(module_name, warm):
+    start = time.perf_counter()
+    import importlib
+
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+
+    warmed = imported
+    if warm:
+        import clients
+
+        clients.warmup(module.app)
+        warmed = time.perf_counter()
+
+    client = module.app.test_client()
+    timings = []
+    for _ in range(2):
+        t = time.perf_counter()
+        status = client.post("/", data=SOUVENIR_FORM).status_code
+        timings.append((time.perf_counter() - t, status))
+    print(json.dumps({
+        "import_s": imported - start,
+        "warmup_s": warmed - imported,
+        "first_request_s": timings[0][0],
+        "second_request_s": timings[1][0],
+        "statuses": [s for _, s in timings],
+        "openai_imported_after_import": "openai" in sys.modules,
+    }))
+
+
+def run_once(module_name, mode, env):
+    cmd = [sys.executable, "-m", "bench.startup", "--child", module_name]
+    if mode == "warmup":
+        cmd.append("--warmup")
+    start = time.perf_counter()
+    out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="import と最初のリクエストまでの時間")
+    parser.add_argument("--app", default="app2", help="測るモジュール（app / app2）")
+    parser.add_argument("--modes", default="cold,warmup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--wiki-latency", default="30:0.3:0.0")
+    parser.add_argument("--openai-latency", default="200:0.2:0.0")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child, args.warmup)
+        return True
+
+    wiki = start_wikipedia_stub(LatencyModel.parse(args.wiki_latency, seed=1))
+    openai_stub = start_openai_stub(LatencyModel.parse(args.openai_latency, seed=2))
+    env = dict(
+        os.environ,
+        WIKI_ENDPOINT=wiki.url + "/w/api.php",
+        OPENAI_BASE_URL=openai_stub.url + "/v1",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "bench"),
+        FLASK_SECRET_KEY=os.environ.get("FLASK_SECRET_KEY", "bench"),
+    )
+    tmp = use_temp_files(env, prefix="bench-startup-")
+    report = {}
+    try:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            runs = [run_once(args.app, mode, env) for _ in range(args.runs)]
+            summary = {
+                key[:-2] + "_ms": round(statistics.median(r[key] for r in runs) * 1000, 1)
+                for key in ("import_s", "warmup_s", "first_request_s", "second_request_s", "process_s")
+            }
+            summary["openai_imported_after_import"] = runs[0]["openai_imported_after_import"]
+            report[mode] = summary
+            print(f"{args.app} {mode:7s} import {summary['import_ms']:7.1f}ms  warmup {summary['warmup_ms']:7.1f}ms  "
+                  f"1st {summary['first_request_ms']:7.1f}ms  2nd {summary['second_request_ms']:7.1f}ms  "
+                  f"(median of {args.runs})")
+    finally:
+        wiki.stop()
+        openai_stub.stop()
+        tmp.cleanup()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,237 @@
+#ベンチマーク用のスタブサーバー
+#
+# 本物の ja.wikipedia.org / OpenAI の代わりにローカルで立ち上げる。
+# 遅延（対数正規分布）とエラー率を設定でき、呼び出し回数を種類ごとに数える。
+# アプリが書き込むファイルを一時ディレクトリに向ける use_temp_files もここに置く（どのベンチからも使う）。
+import hashlib
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class LatencyModel:
+    # median_ms を中央値、sigma をばらつきとした対数正規分布で遅延を決める
+    def __init__(self, median_ms=50.0, sigma=0.5, error_rate=0.0, error_status=500, seed=0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            delay = self.median_ms * math.exp(self._rng.gauss(0.0, self.sigma)) if self.median_ms > 0 else 0.0
+            failed = self._rng.random() < self.error_rate
+        return delay / 1000.0, failed
+
+    @classmethod
+    def parse(cls, spec, seed=0):
+        # "50"、"50:0.5"、"50:0.5:0.01" の形式（中央値ms:sigma:エラー率）
+        parts = [float(x) for x in str(spec).split(":")]
+        median = parts[0]
+        sigma = parts[1] if len(parts) > 1 else 0.5
+        error_rate = parts[2] if len(parts) > 2 else 0.0
+        return cls(median, sigma, error_rate, seed=seed)
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # 同時接続が多いとき、listen の待ち行列（デフォルト 5）があふれて接続の再送待ちが遅延に混ざらないようにする
+    request_queue_size = 256
+
+    def __init__(self, handler, latency, port=0):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency = latency
+        self.calls = {}
+        self._calls_lock = threading.Lock()
+        self._thread = None
+
+    def count(self, kind, failed):
+        key = f"{kind}:error" if failed else kind
+        with self._calls_lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def reset_counts(self):
+        with self._calls_lock:
+            self.calls = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書くので、keep-alive の接続で Nagle と遅延 ACK の待ち（40ms）が入らないようにする
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def delay_or_fail(self, kind):
+        delay, failed = self.server.latency.sample()
+        time.sleep(delay)
+        self.server.count(kind, failed)
+        if failed:
+            self.send_json(self.server.latency.error_status, {"error": {"message": "stub error"}})
+        return failed
+
+
+def title_hash(title):
+    return int.from_bytes(hashlib.md5(title.encode("utf-8")).digest()[:8], "big")
+
+
+#京都市周辺（±0.15度）に散らばる座標。1割の記事は座標なし
+def stub_lat(h):
+    return round(35.0 + ((h >> 8) % 3000 - 1500) / 10000, 6)
+
+
+def stub_lon(h):
+    return round(135.75 + ((h >> 20) % 3000 - 1500) / 10000, 6)
+
+
+#MediaWiki API (action=query) のスタブ
+class WikipediaHandler(_JSONHandler):
+    def do_GET(self):
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        if query.get("list") == "search":
+            kind = "search"
+        else:
+            kind = query.get("prop", "query")
+        props = set(kind.split("|"))
+        if self.delay_or_fail(kind):
+            return
+
+        if kind == "search":
+            limit = int(query.get("srlimit", 10))
+            base = query.get("srsearch", "")
+            results = [{"title": f"{base} スポット{i}"} for i in range(limit)]
+            self.send_json(200, {"query": {"search": results}})
+            return
+
+        titles = [t for t in query.get("titles", "").split("|") if t]
+        pages = {}
+        for title in titles:
+            h = title_hash(title)
+            page = {"pageid": h % 10_000_000, "title": title}
+            if "coordinates" in props and h % 10:
+                page["coordinates"] = [{"lat": stub_lat(h), "lon": stub_lon(h), "primary": "", "globe": "earth"}]
+            if "pageimages" in props and h % 4:
+                page["pageimage"] = f"{h:x}.jpg"
+                page["thumbnail"] = {
+                    "source": f"https://upload.example.invalid/{h:x}.jpg",
+                    "width": 300,
+                    "height": 200,
+                }
+            pages[str(page["pageid"])] = page
+        self.send_json(200, {"query": {"pages": pages}})
+
+
+#OpenAI chat.completions のスタブ
+SOUVENIR_NAMES = ["八ツ橋", "生八ツ橋", "抹茶", "千枚漬け", "白い恋人", "もみじ饅頭", "博多通りもん", "ちんすこう"]
+
+
+def souvenir_completion(count):
+    lines = []
+    for i in range(count):
+        name = SOUVENIR_NAMES[i % len(SOUVENIR_NAMES)]
+        lines.append(
+            f"{i + 1}. {name}：{name}は定番のお土産で、ご家族にも喜ばれます。"
+            "日持ちもしやすく、駅や空港の売店で購入できます。"
+        )
+    return "\n".join(lines)
+
+
+class OpenAIHandler(_JSONHandler):
+    # models.list（起動時のウォームアップで使う）
+    def do_GET(self):
+        if self.delay_or_fail("models"):
+            return
+        models = [{"id": m, "object": "model", "created": 0, "owned_by": "stub"} for m in ("gpt-4.1-mini", "gpt-4o-mini")]
+        self.send_json(200, {"object": "list", "data": models})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        messages = payload.get("messages", [])
+        is_vision = any(isinstance(m.get("content"), list) for m in messages)
+        kind = "vision" if is_vision else "chat"
+        if self.delay_or_fail(kind):
+            return
+
+        if is_vision and (payload.get("response_format") or {}).get("type") == "json_schema":
+            content = json.dumps({"amount": 1234, "currency": "JPY", "confidence": 0.95, "line": "合計 ¥1,234"},
+                                 ensure_ascii=False)
+        elif is_vision:
+            content = "1234"
+        elif (payload.get("response_format") or {}).get("type") == "json_object":
+            # スポット説明文の生成（"- スポット名" の行ごとに1文返す）
+            prompt = "".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+            titles = [line[2:] for line in prompt.splitlines() if line.startswith("- ")]
+            content = json.dumps({t: f"{t}は地元でも人気のスポットです。" for t in titles}, ensure_ascii=False)
+        else:
+            prompt = "".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+            count = 4 if "4つ提案" in prompt else 6
+            content = souvenir_completion(count)
+
+        self.send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(json.dumps(messages, ensure_ascii=False)) // 2,
+                "completion_tokens": len(content) // 2,
+                "total_tokens": len(json.dumps(messages, ensure_ascii=False)) // 2 + len(content) // 2,
+            },
+        })
+
+
+def start_wikipedia_stub(latency, port=0):
+    return _StubServer(WikipediaHandler, latency, port).start()
+
+
+def start_openai_stub(latency, port=0):
+    return _StubServer(OpenAIHandler, latency, port).start()
+
+
+#スポット説明文・家計簿・為替レートのファイルを一時ディレクトリに作るよう環境変数を設定する
+# アプリのモジュールは import 時にパスを読むので、import する前（子プロセスなら起動する前）に呼ぶ。
+# env を渡すとその dict に設定する（子プロセス用）。使い終わったら戻り値の cleanup() を呼ぶ
+def use_temp_files(env=None, prefix="bench-"):
+    env = os.environ if env is None else env
+    tmp = tempfile.TemporaryDirectory(prefix=prefix)
+    env["SPOT_DESCRIPTIONS_FILE"] = os.path.join(tmp.name, "spot_descriptions.jsonl")
+    env["LEDGER_DB"] = os.path.join(tmp.name, "ledger.db")
+    env["EXCHANGE_RATES_FILE"] = os.path.join(tmp.name, "exchange_rates.json")
+    return tmp
@@ -0,0 +1,129 @@
+#/analyze_receipt のメモリ使用量ベンチマーク
+#
+# app2 を別プロセスで起動し（スタブの OpenAI とクライアントはこちらのプロセス）、同時にレシート画像を送ったときの
+# サーバープロセスのピーク RSS（/proc/<pid>/status の VmHWM）を測る。
+# --modes buffered は以前の実装（read() → b64encode → decode → f-string）に差し替えて比べる。
+#
+#   python -m bench.upload_memory --image-kb 6000 --concurrency 8 --requests 32
+#
+# Linux 専用（VmHWM を読むため）。
+import argparse
+import base64
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from bench.load import Scenario, percentile, run_load
+from bench.stubs import LatencyModel, start_openai_stub, use_temp_files
+
+
+#以前の実装：画像の約5倍をメモリに持つ
+# 以前は image_bytes / base64_image がルート関数のローカル変数で、OpenAI の応答が返るまで残っていたので g に置いて再現する
+def buffered_data_url(stream, mimetype):
+    from flask import g
+
+    image_bytes = stream.read()
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+    g.receipt_buffers = (image_bytes, base64_image)
+    return f"data:{mimetype};base64,{base64_image}", len(image_bytes)
+
+
+def serve(mode):
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    from bench.load import start_app
+    import receipts
+
+    if mode == "buffered":
+        receipts.image_data_url = buffered_data_url
+    server, base_url = start_app("app2")
+    print(base_url, flush=True)
+    # 親プロセスが stdin を閉じたら終わる
+    sys.stdin.read()
+    server.shutdown()
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(mode, args, image, openai_url):
+    env = dict(os.environ, OPENAI_BASE_URL=openai_url + "/v1")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench.upload_memory", "--serve", mode],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env,
+    )
+    try:
+        base_url = proc.stdout.readline().strip()
+        scenario = Scenario("receipt", "POST", "/analyze_receipt",
+                            files={"image": ("receipt.jpg", image, "image/jpeg")})
+        # 起動直後の import などの分を先に出しておく
+        run_load(base_url, [scenario], 1, 2)
+        idle = peak_rss_mb(proc.pid)
+
+        results, wall = run_load(base_url, [scenario], args.concurrency, args.requests)
+        latencies = sorted(elapsed for _, elapsed, status in results if status == 200)
+        errors = sum(1 for _, _, status in results if status != 200)
+        peak = peak_rss_mb(proc.pid)
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=30)
+    return {
+        "mode": mode,
+        "idle_peak_rss_mb": round(idle, 1),
+        "peak_rss_mb": round(peak, 1),
+        "growth_mb": round(peak - idle, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "errors": errors,
+        "wall_s": round(wall, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="/analyze_receipt のピーク RSS")
+    parser.add_argument("--modes", default="buffered,streaming")
+    parser.add_argument("--image-kb", type=int, default=6000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--openai-latency", default="300:0.2:0.0")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve)
+        return True
+
+    image = os.urandom(args.image_kb * 1024)
+    openai_stub = start_openai_stub(LatencyModel.parse(args.openai_latency, seed=1))
+    # サーバーの子プロセスは os.environ を引き継ぐので、ここで一時ディレクトリに向けておく
+    tmp = use_temp_files(prefix="bench-upload-")
+    report = []
+    try:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            start = time.perf_counter()
+            result = measure(mode, args, image, openai_stub.url)
+            report.append(result)
+            print(f"{mode:10s} peak {result['peak_rss_mb']:7.1f}MB  (+{result['growth_mb']:.1f}MB over idle)  "
+                  f"p50 {result['p50_ms']:.0f}ms  errors {result['errors']}  "
+                  f"[{time.perf_counter() - start:.1f}s]")
+    finally:
+        openai_stub.stop()
+        tmp.cleanup()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,46 @@
+#スレッドセーフな LRU キャッシュ
+#
+# ヒット / ミスは metrics の app_cache_requests_total{cache=name} に記録される。
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, name, maxsize=1024, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is not MISSING and self.ttl is not None and entry[1] < time.monotonic():
+                del self._data[key]
+                entry = MISSING
+            if entry is not MISSING:
+                self._data.move_to_end(key)
+        metrics.record_cache(self.name, entry is not MISSING)
+        return default if entry is MISSING else entry[0]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,113 @@
+#外部サービスのクライアントの遅延初期化とウォームアップ
+#
+# openai の import とクライアントの生成は重い（import だけで 0.2 秒ほど）ので、最初に使うときまで遅らせる。
+#   clients.OPENAI は OpenAI() と同じように clients.OPENAI.chat.completions.create(...) で使える
+#   clients.chat(task, messages) はモデルの選択（router）・トレース・メトリクスをまとめて行う
+#
+# warmup(app) はワーカーがリクエストを受ける前に呼ぶ。
+#   - OpenAI クライアントを作り、接続を張っておく（models.list を1回）
+#   - Wikipedia への接続プールに接続を張っておく
+#   - tiktoken のエンコーディングを読み込み、app があれば "/" を1回描画する
+# gunicorn なら設定ファイルで:
+#   def post_worker_init(worker):
+#       import clients
+#       clients.warmup(worker.wsgi)
+# python app2.py で起動したときは起動前に呼ぶ。
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import metrics
+import router
+import tracing
+import wiki
+
+
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", 10))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_openai = None
+
+
+def openai_client():
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                from openai import OpenAI
+                _openai = OpenAI()
+    return _openai
+
+
+class LazyOpenAI:
+    def __getattr__(self, name):
+        return getattr(openai_client(), name)
+
+
+OPENAI = LazyOpenAI()
+
+
+#router の task で選んだモデルに chat.completions を投げ、(回答の本文, 使ったモデル) を返す
+# span / upstream はトレースとメトリクスでの呼び出し先の名前、attributes は span に足す属性。
+def chat(task, messages, span="openai.chat.completions", upstream="openai_chat", hedge=False, attributes=None, **params):
+    def request(model):
+        with tracing.span(span, **{"gen_ai.request.model": model}) as s, metrics.upstream(upstream) as call:
+            for key, value in (attributes or {}).items():
+                s.set_attribute(key, value)
+            response = OPENAI.chat.completions.create(model=model, messages=messages, **params)
+            call.status = 200
+            if response.usage is not None:
+                s.set_attribute("gen_ai.usage.input_tokens", response.usage.prompt_tokens)
+                s.set_attribute("gen_ai.usage.output_tokens", response.usage.completion_tokens)
+        metrics.record_usage(model, response.usage)
+        return response
+
+    response, model = router.ROUTER.call(task, request, hedge=hedge)
+    return response.choices[0].message.content, model
+
+
+def _warm_openai():
+    openai_client().models.list()
+
+
+def _warm_tokenizer():
+    import prompts
+
+    prompts.count_tokens("")
+
+
+#接続やキャッシュを温めておき、項目ごとにかかった秒数（失敗したものは None）を返す
+def warmup(app=None, timeout=WARMUP_TIMEOUT_SECONDS):
+    tasks = {
+        "openai": _warm_openai,
+        "wikipedia": wiki.warmup,
+        "tokenizer": _warm_tokenizer,
+    }
+    timings = {}
+
+    def run(name, fn):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            logger.warning("warmup: %s failed", name, exc_info=True)
+            timings[name] = None
+        else:
+            timings[name] = time.perf_counter() - start
+
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warmup")
+    futures = [executor.submit(run, name, fn) for name, fn in tasks.items()]
+    if app is not None:
+        def render_index():
+            with app.test_client() as c:
+                c.get("/")
+        run("index", render_index)
+    wait(futures, timeout=timeout)
+    # 時間内に終わらなかったものは待たない（裏で最後まで走らせる）
+    executor.shutdown(wait=False)
+    logger.info("warmup: %s", {k: None if v is None else round(v, 3) for k, v in timings.items()})
+    return timings
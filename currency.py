@@ -0,0 +1,171 @@
+#通貨の判定と円換算
+#
+# レシートの通貨を円に換算するためのレート表をメモリに持つ。リクエスト中はネットワークを使わない。
+#   1. 起動時は EXCHANGE_RATES_FILE（前回取得した表）を読む。なければ組み込みの目安レート
+#   2. EXCHANGE_RATES_URL があれば、バックグラウンドのスレッドが REFRESH_SECONDS ごとに取り直し、ファイルにも保存する
+#      URL がなければファイルの更新（mtime）を見て読み直す（手で置いた表や別プロセスが更新した表を使う）
+# 表の形式は {"base": "USD", "date": "2026-10-01", "rates": {"JPY": 150.1, "EUR": 0.92, ...}}（base 1 単位あたり）。
+# 取り直しに失敗したときは手元の表をそのまま使い続ける。
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+
+import metrics
+
+
+RATES_FILE = os.environ.get("EXCHANGE_RATES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exchange_rates.json"))
+RATES_URL = os.environ.get("EXCHANGE_RATES_URL", "")
+REFRESH_SECONDS = float(os.environ.get("EXCHANGE_RATES_REFRESH_SECONDS", 6 * 60 * 60))
+
+# 表が手に入らないときの目安（1 単位あたりの円）
+DEFAULT_JPY_RATES = {
+    "JPY": 1.0,
+    "USD": 150.0, "EUR": 162.0, "GBP": 190.0, "AUD": 98.0, "CAD": 108.0, "CHF": 170.0,
+    "CNY": 21.0, "HKD": 19.3, "TWD": 4.7, "KRW": 0.108, "SGD": 112.0,
+    "THB": 4.2, "VND": 0.0059, "PHP": 2.6, "MYR": 32.0, "IDR": 0.0093,
+}
+
+# 行の中にあれば通貨が決まる表記（「$」「¥」「元」だけでは国が決まらないので入れない）
+# 前から順に見るので、「US$」のように別の表記（「S$」）を含むものを先に置く
+CURRENCY_MARKS = (
+    ("NT$", "TWD"), ("HK$", "HKD"), ("US$", "USD"), ("S$", "SGD"), ("A$", "AUD"), ("C$", "CAD"),
+    ("₩", "KRW"), ("€", "EUR"), ("£", "GBP"), ("฿", "THB"), ("₫", "VND"), ("₱", "PHP"),
+    ("円", "JPY"), ("원", "KRW"),
+)
+
+RATE_REFRESHES = metrics.REGISTRY.register(metrics.Counter(
+    "app_exchange_rate_refresh_total",
+    "為替レート表の取り直し回数（結果別）",
+    ("outcome",),
+))
+
+logger = logging.getLogger(__name__)
+
+
+#レシートの行から通貨を判定する。はっきりしなければ None
+def detect(line):
+    text = line or ""
+    for code in re.findall(r"(?<![A-Z])[A-Z]{3}(?![A-Z])", text.upper()):
+        if code in DEFAULT_JPY_RATES:
+            return code
+    for mark, code in CURRENCY_MARKS:
+        if mark in text:
+            return code
+    return None
+
+
+#{"base", "rates"} の表を「1 単位あたりの円」の dict にする
+def parse_rates(data):
+    base = data["base"].upper()
+    rates = {code.upper(): float(value) for code, value in data["rates"].items()}
+    rates[base] = 1.0
+    jpy = rates["JPY"]
+    table = {code: jpy / value for code, value in rates.items() if value > 0}
+    table["JPY"] = 1.0
+    return table
+
+
+def _fetch_url(url):
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+class RateTable:
+    def __init__(self, path=RATES_FILE, url=RATES_URL, fetch=None):
+        self.path = path
+        self.url = url
+        self._fetch = fetch or _fetch_url
+        # 表は丸ごと差し替える（読む側はロックを取らない）
+        self._rates = dict(DEFAULT_JPY_RATES)
+        self.date = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.load_file()
+
+    def load_file(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            rates = parse_rates(data)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            logger.warning("exchange rates: cannot read %s", self.path, exc_info=True)
+            return False
+        self._rates = {**DEFAULT_JPY_RATES, **rates}
+        self.date = data.get("date")
+        self._mtime = mtime
+        return True
+
+    def refresh(self):
+        if not self.url:
+            if self.load_file():
+                RATE_REFRESHES.inc(outcome="file")
+            return
+        try:
+            data = self._fetch(self.url)
+            rates = parse_rates(data)
+        except Exception:
+            RATE_REFRESHES.inc(outcome="error")
+            logger.warning("exchange rates: fetch from %s failed, keeping the current table", self.url, exc_info=True)
+            return
+        self._rates = {**DEFAULT_JPY_RATES, **rates}
+        self.date = data.get("date")
+        RATE_REFRESHES.inc(outcome="url")
+        # 次に起動したときにすぐ使えるよう保存しておく
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError:
+            logger.warning("exchange rates: cannot write %s", self.path, exc_info=True)
+
+    #1 単位あたりの円。知らない通貨は None
+    def rate(self, currency):
+        self.start()
+        return self._rates.get((currency or "").upper())
+
+    def to_jpy(self, amount, currency):
+        rate = self.rate(currency)
+        if rate is None or amount is None:
+            return None
+        return round(amount * rate)
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="exchange-rates-refresher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("exchange rate refresh failed")
+            time.sleep(REFRESH_SECONDS)
+
+
+TABLE = RateTable()
+
+
+def to_jpy(amount, currency):
+    return TABLE.to_jpy(amount, currency)
+
+
+def rate(currency):
+    return TABLE.rate(currency)
@@ -0,0 +1,145 @@
+#旅行プランのスポット説明文（LLM で生成）
+#
+# スポット名をまとめて1回のプロンプトに入れ（BATCH_SIZE 件ずつ）、短い説明文を JSON で返してもらう。
+# 生成した説明文はタイトルごとに永続キャッシュする（SPOT_DESCRIPTIONS_FILE に1行1件の JSON で追記）。
+# キャッシュにないスポットはバッチごとに並列で生成し、呼び出し側は締め切りまでに届いた分だけ使う。
+# 締め切りに間に合わなかったバッチもバックグラウンドで最後まで走り、次のプランからはキャッシュが使われる。
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import clients
+import metrics
+
+
+CACHE_FILE = os.environ.get("SPOT_DESCRIPTIONS_FILE", "spot_descriptions.jsonl")
+BATCH_SIZE = int(os.environ.get("ENRICH_BATCH_SIZE", 20))
+MAX_WORKERS = int(os.environ.get("ENRICH_MAX_WORKERS", 4))
+# 説明文の生成を待つ上限（これを過ぎたら定型文で埋める）
+BUDGET_SECONDS = float(os.environ.get("ENRICH_BUDGET_SECONDS", 2.0))
+
+PROMPT = """あなたは日本の観光ガイドです。
+{destination}を旅行する人向けに、次の各スポットを40字以内の日本語で1文ずつ紹介してください。
+知らないスポットは無理に説明せず、値を空文字にしてください。
+スポット名をキー、紹介文を値とした JSON オブジェクトだけを返してください。
+
+{titles}
+"""
+
+logger = logging.getLogger(__name__)
+
+
+#clients.chat（router の "enrich" タスク。モデルは ENRICH_MODEL / MODEL_ROUTES）で説明文を作る生成関数を作る
+# 戻り値の関数は (titles, destination) -> {title: 説明文}
+def openai_generator(chat=None):
+    chat = chat or clients.chat
+
+    def generate(titles, destination):
+        prompt = PROMPT.format(destination=destination, titles="\n".join(f"- {t}" for t in titles))
+        text, _ = chat(
+            "enrich", [{"role": "user", "content": prompt}],
+            span="openai.enrich", upstream="openai_enrich", attributes={"titles": len(titles)},
+            response_format={"type": "json_object"}, max_tokens=80 * len(titles),
+        )
+        data = json.loads(text or "{}")
+        if not isinstance(data, dict):
+            return {}
+        return {t: str(data[t]).strip() for t in titles if data.get(t)}
+
+    return generate
+
+
+class DescriptionStore:
+    def __init__(self, generate, path=CACHE_FILE, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+        self._generate = generate
+        self._path = path
+        self._batch_size = batch_size
+        self._descriptions = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="enrich")
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self):
+        return len(self._descriptions)
+
+    def _load(self, path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                    self._descriptions[item["title"]] = item["description"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def get(self, title):
+        return self._descriptions.get(title)
+
+    #キャッシュにないタイトルの生成を始める（すでに生成中のものは重ねて頼まない）
+    # 戻り値は {title: Future}
+    def prefetch(self, titles, destination):
+        futures = {}
+        todo = []
+        with self._lock:
+            for title in dict.fromkeys(titles):
+                if title in self._descriptions:
+                    continue
+                future = self._inflight.get(title)
+                if future is None:
+                    todo.append(title)
+                else:
+                    futures[title] = future
+
+            for i in range(0, len(todo), self._batch_size):
+                batch = todo[i:i + self._batch_size]
+                # 生成中のスパンが今のリクエストのトレースにぶら下がるよう、コンテキストを引き継ぐ
+                ctx = contextvars.copy_context()
+                future = self._executor.submit(ctx.run, self._run_batch, batch, destination)
+                for title in batch:
+                    self._inflight[title] = future
+                    futures[title] = future
+        return futures
+
+    def _run_batch(self, titles, destination):
+        try:
+            result = self._generate(titles, destination)
+        except Exception:
+            logger.exception("spot description batch failed (%d titles)", len(titles))
+            result = {}
+
+        with self._lock:
+            for title in titles:
+                self._inflight.pop(title, None)
+            new = {t: d for t, d in result.items() if t not in self._descriptions}
+            self._descriptions.update(new)
+            if new and self._path:
+                with open(self._path, "a", encoding="utf-8") as f:
+                    for title, description in new.items():
+                        f.write(json.dumps({"title": title, "description": description}, ensure_ascii=False) + "\n")
+        return result
+
+    #締め切り（time.monotonic() の値）までに用意できた説明文を {title: 説明文} で返す
+    def describe(self, titles, destination, deadline=None):
+        if deadline is None:
+            deadline = time.monotonic() + BUDGET_SECONDS
+        result = {}
+        for title in titles:
+            description = self._descriptions.get(title)
+            metrics.record_cache("spot_descriptions", description is not None)
+            if description is not None:
+                result[title] = description
+
+        futures = self.prefetch([t for t in titles if t not in result], destination)
+        if futures:
+            with metrics.stage("enrich_wait"):
+                wait(set(futures.values()), timeout=max(0.0, deadline - time.monotonic()))
+            for title in futures:
+                description = self._descriptions.get(title)
+                if description is not None:
+                    result[title] = description
+        return result
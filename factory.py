@@ -0,0 +1,200 @@
+#アプリの組み立て（app.py / app2.py 共通）
+#
+#   app = factory.create_app(__name__, INDEX_HTML, TRIP_BLOCK, souvenir_count=6)
+#
+# 画面（INDEX_HTML / TRIP_BLOCK）とお土産の数はアプリごとに渡し、
+# "/"（旅行プラン・お土産検索）と "/trip/stream" の処理、プランの1日分の描画はここで共通にする。
+# remember=True なら入力と結果をセッションに覚えておき、次に開いたときも表示する（app2.py）。
+# レシートや家計簿などアプリ固有の機能は、できた app に各モジュールの init_app で足す。
+import json
+import random
+
+from flask import Flask, Response, render_template_string, request, session, stream_with_context, url_for
+from jinja2 import Environment
+from markupsafe import Markup
+
+import metrics
+import places
+import profiler
+import services
+import tracing
+
+
+TRIP_HEADER = r"""
+<hr style="margin:40px 0; border:none; border-top:1px solid #ddd;">
+<h2 style="text-align:center;">{{ destination }} {{ days }}日プラン</h2>
+{% if share_url %}
+<p class="sub"><a href="{{ share_url }}">このプランを共有するURL</a></p>
+{% endif %}
+"""
+
+DAY_CARD = r"""
+  <div class="result-card">
+    <h3>Day {{ d.day }}</h3>
+    {% for s in d.schedule %}
+      <p style="margin:12px 0;">
+        <b>{{ s.time }}</b> {{ s.title }}<br>
+        {{ s.detail }}<br>
+        <span style="color:#6b7a8c; font-size:0.9rem;">Tips: {{ s.tips }}</span>
+      </p>
+    {% endfor %}
+  </div>
+"""
+
+# 日数はフォームと同じ 1〜7 日に収める（共有URLや /trip/stream は直接書き換えられる）
+MIN_DAYS = 1
+MAX_DAYS = 7
+
+
+def clamp_days(days):
+    return min(max(days, MIN_DAYS), MAX_DAYS)
+
+
+# seed の指定がなければ新しく選ぶ（0 も有効な seed）
+def new_seed(seed):
+    return random.randrange(1 << 31) if seed is None else seed
+
+
+# 1日ずつ何度も描画するので、テンプレートは一度だけコンパイルしておく
+_jinja_env = Environment(autoescape=True)
+_trip_header_template = _jinja_env.from_string(TRIP_HEADER)
+_day_card_template = _jinja_env.from_string(DAY_CARD)
+
+
+def render_trip_header(destination, days, share_url):
+    return Markup(_trip_header_template.render(destination=destination, days=days, share_url=share_url))
+
+
+def render_day_card(day):
+    return Markup(_day_card_template.render(d=day))
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def create_app(import_name, index_html, trip_block, souvenir_count, remember=False, trips=None):
+    app = Flask(import_name)
+    metrics.init_app(app)
+    tracing.init_app(app)
+
+    trips = trips or services.TRIPS
+    souvenir_service = services.SouvenirService(count=souvenir_count)
+    app.extensions["trips"] = trips
+    app.extensions["souvenirs"] = souvenir_service
+
+    def build_trip(destination, days, style, seed):
+        with tracing.span("build_trip", destination=destination, days=days, style=style), \
+                metrics.stage("build_trip"):
+            return trips.build_trip(destination, days, style, seed)
+
+    # プラン本体はセッション（Cookie）に入れず、seed から作り直す（同じ seed なら作成済みのキャッシュが使われる）
+    def remember_trip(destination, days, style, seed):
+        if remember:
+            session.pop("trip", None)
+            session["destination"] = destination
+            session["days"] = days
+            session["style"] = style
+            session["seed"] = seed
+
+    @app.route("/", methods=["GET", "POST"])
+    @profiler.profiled
+    def index():
+        trip = None
+        destination = None
+        days = 3
+        style = "王道観光"
+        seed = None
+        souvenirs = []
+        restore_url = None
+        if remember:
+            destination = session.get("destination")
+            days = session.get("days", 3)
+            style = session.get("style", "王道観光")
+            seed = session.get("seed")
+            souvenirs = session.get("souvenirs", [])
+            # 前回のプランは作成済みのときだけここで描画する
+            # なければ画面を先に返し、画面から /trip/stream で作り直す（お土産検索などを待たせない）
+            if destination and seed is not None:
+                trip = trips.cached(destination, days, style, seed)
+                if trip is None:
+                    restore_url = url_for("index", destination=destination, days=days, style=style, seed=seed)
+
+        # 共有URL（?destination=...&seed=...）で開かれたときは同じプランを表示する
+        if request.method == "GET" and request.args.get("destination"):
+            destination = places.canonical(request.args.get("destination"))
+            days = clamp_days(request.args.get("days", 3, type=int))
+            style = request.args.get("style", "王道観光")
+            seed = request.args.get("seed", type=int)
+            trip = build_trip(destination, days, style, seed)
+            remember_trip(destination, days, style, seed)
+
+        if request.method == "POST":
+            if "trip_submit" in request.form:
+                destination = places.canonical(request.form.get("destination"))
+                days = clamp_days(request.form.get("days", 3, type=int))
+                style = request.form.get("style", "王道観光")
+                seed = new_seed(request.form.get("seed", type=int))
+                trip = build_trip(destination, days, style, seed)
+                remember_trip(destination, days, style, seed)
+
+            if "souvenir_submit" in request.form:
+                souvenirs = souvenir_service.suggest(request.form)
+                if remember:
+                    session["souvenirs"] = souvenirs
+
+        share_url = None
+        if trip and seed is not None:
+            share_url = url_for("index", destination=destination, days=days, style=style, seed=seed)
+
+        with metrics.stage("render_trip_block"):
+            block = Markup(
+                render_template_string(
+                    trip_block,
+                    trip=trip,
+                    destination=destination,
+                    days=days,
+                    style=style,
+                    restore_url=None if trip else restore_url,
+                    trip_header=render_trip_header(destination, days, share_url) if trip else "",
+                    day_cards=[render_day_card(d) for d in trip or []]
+                )
+            )
+
+        with metrics.stage("render_index"):
+            return render_template_string(
+                index_html,
+                trip_block=block,
+                souvenirs=souvenirs,
+                form=request.form,
+                destination=destination,
+                days=days,
+                style=style
+            )
+
+    @app.route("/trip/stream")
+    def trip_stream():
+        destination = places.canonical(request.args.get("destination") or "京都")
+        days = clamp_days(request.args.get("days", 3, type=int))
+        style = request.args.get("style") or "王道観光"
+        seed = new_seed(request.args.get("seed", type=int))
+        share_url = url_for("index", destination=destination, days=days, style=style, seed=seed)
+
+        remember_trip(destination, days, style, seed)
+
+        # 1日分できるたびに送る（最初の日は全日程の計算を待たずに表示される）
+        def events():
+            yield sse_event("plan", {"html": render_trip_header(destination, days, share_url)})
+            with tracing.span("build_trip", destination=destination, days=days, style=style, stream=True), \
+                    metrics.stage("build_trip"):
+                for day in trips.iter_trip(destination, days, style, seed):
+                    yield sse_event("day", {"day": day["day"], "html": render_day_card(day)})
+            yield sse_event("done", {"share_url": share_url})
+
+        return Response(
+            stream_with_context(tracing.stream(events())),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return app
@@ -0,0 +1,354 @@
+#予算管理の支出台帳（サーバー側）
+#
+# SQLite（WAL）に追記だけのログとして保存する。削除も「delete」の行を足すだけで、行を書き換えることはない。
+# 各行には台帳内で増え続ける seq が付くので、クライアントは最後に受け取った seq（カーソル）を覚えておき、
+# POST /api/ledgers/<id>/sync で「まだ送っていない変更」を送り「カーソル以降の変更」だけを受け取る。
+# 台帳 ID はクライアントが作るランダムな文字列で、同じ ID を使えば別の端末からも同じ台帳を使える。
+#
+#   op = "add"    : 支出の追加（entry_id は支出の ID）
+#   op = "delete" : 支出の削除（entry_id は消す支出の ID）
+#   op = "budget" : 総予算の変更（entry_id は変更操作の ID、amount が新しい予算）
+#
+# 合計（旅全体・カテゴリ別・日別）は ledger_totals に持ち、追記と同じトランザクションで足し引きする。
+# 集計を読むときは履歴をたどらないので、支出が何件あっても summary は集計の行数ぶんしか読まない。
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import request
+
+import metrics
+import tracing
+
+
+DB_PATH = os.environ.get("LEDGER_DB", "ledger.db")
+OPS = ("add", "delete", "budget")
+MAX_CHANGES = 500
+PAGE_SIZE = 100
+MAX_CATEGORY_CHARS = 50
+# 1件の金額の上限（円）。合計も SQLite の整数（64bit）に収まるようにする
+MAX_AMOUNT = 10 ** 12
+# 変更の番号（since / before）として受け付ける範囲（SQLite の整数は 64bit）
+MAX_SEQ = 2 ** 63 - 1
+
+_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ledger TEXT NOT NULL,
+    op TEXT NOT NULL,
+    entry_id TEXT NOT NULL,
+    amount INTEGER,
+    category TEXT,
+    date TEXT,
+    time TEXT,
+    day TEXT,
+    created_at REAL NOT NULL,
+    UNIQUE (ledger, op, entry_id)
+);
+CREATE INDEX IF NOT EXISTS ledger_log_ledger_seq ON ledger_log (ledger, seq);
+CREATE TABLE IF NOT EXISTS ledger_totals (
+    ledger TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    amount INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ledger, kind, key)
+) WITHOUT ROWID;
+"""
+
+# ledger_totals の kind
+#   trip     : key は空。使った合計と件数
+#   category : key はカテゴリ名
+#   day      : key は YYYY-MM-DD（端末の日付）
+#   budget   : key は空。amount が最新の総予算
+TOTAL_KINDS = ("trip", "category", "day")
+
+
+class LedgerError(ValueError):
+    pass
+
+
+class Ledger:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _validate(self, change):
+        if not isinstance(change, dict):
+            raise LedgerError("change must be an object")
+        op = change.get("op")
+        if op not in OPS:
+            raise LedgerError(f"unknown op: {op!r}")
+        entry_id = str(change.get("id") or "")
+        if not _ID_RE.match(entry_id):
+            raise LedgerError("invalid id")
+        row = {"op": op, "entry_id": entry_id, "amount": None, "category": None, "date": None, "time": None}
+        if op in ("add", "budget"):
+            try:
+                amount = int(change.get("amount"))
+            except (TypeError, ValueError, OverflowError):
+                raise LedgerError("amount must be an integer")
+            if amount < 0:
+                raise LedgerError("amount must not be negative")
+            if amount > MAX_AMOUNT:
+                raise LedgerError(f"amount must be at most {MAX_AMOUNT}")
+            row["amount"] = amount
+        row["day"] = None
+        if op == "add":
+            row["category"] = str(change.get("category") or "未分類")[:MAX_CATEGORY_CHARS]
+            row["date"] = str(change.get("date") or "")[:20]
+            row["time"] = str(change.get("time") or "")[:20]
+            day = str(change.get("day") or "")
+            row["day"] = day if _DAY_RE.match(day) else time.strftime("%Y-%m-%d")
+        return row
+
+    def _add_total(self, conn, ledger_id, kind, key, amount, count):
+        conn.execute(
+            "INSERT INTO ledger_totals (ledger, kind, key, amount, count) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (ledger, kind, key) DO UPDATE SET amount = amount + excluded.amount, count = count + excluded.count",
+            (ledger_id, kind, key, amount, count),
+        )
+
+    def _apply_totals(self, conn, ledger_id, op, amount, category, day, sign=1):
+        if op == "budget":
+            conn.execute(
+                "INSERT INTO ledger_totals (ledger, kind, key, amount, count) VALUES (?, 'budget', '', ?, 1)"
+                " ON CONFLICT (ledger, kind, key) DO UPDATE SET amount = excluded.amount, count = count + 1",
+                (ledger_id, amount),
+            )
+            return
+        for kind, key in (("trip", ""), ("category", category), ("day", day or "")):
+            self._add_total(conn, ledger_id, kind, key, sign * amount, sign)
+
+    #変更をまとめて追記する（同じ op と ID の組はすでにあれば無視するので、送り直しても二重にならない）
+    # 実際に追記できた行だけ、同じトランザクションで集計に足し引きする
+    def append(self, ledger_id, changes):
+        rows = [self._validate(c) for c in changes]
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            for r in rows:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO ledger_log (ledger, op, entry_id, amount, category, date, time, day, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (ledger_id, r["op"], r["entry_id"], r["amount"], r["category"], r["date"], r["time"], r["day"], now),
+                )
+                if cur.rowcount != 1:
+                    continue
+                if r["op"] == "delete":
+                    added = conn.execute(
+                        "SELECT amount, category, day FROM ledger_log WHERE ledger = ? AND op = 'add' AND entry_id = ?",
+                        (ledger_id, r["entry_id"]),
+                    ).fetchone()
+                    if added is not None:
+                        self._apply_totals(conn, ledger_id, "add", added["amount"], added["category"], added["day"], sign=-1)
+                elif r["op"] == "add":
+                    deleted = conn.execute(
+                        "SELECT 1 FROM ledger_log WHERE ledger = ? AND op = 'delete' AND entry_id = ?",
+                        (ledger_id, r["entry_id"]),
+                    ).fetchone()
+                    if deleted is None:
+                        self._apply_totals(conn, ledger_id, "add", r["amount"], r["category"], r["day"])
+                else:
+                    self._apply_totals(conn, ledger_id, "budget", r["amount"], None, None)
+
+    #カーソル（seq）より後の変更を古い順に返す
+    # delete には消した支出の金額も付ける（クライアントが読み込んでいない支出でも合計を減らせるように）
+    def changes(self, ledger_id, since=0, limit=MAX_CHANGES):
+        rows = self._connect().execute(
+            "SELECT l.seq, l.op, l.entry_id, COALESCE(l.amount, a.amount) AS amount, l.category, l.date, l.time"
+            " FROM ledger_log AS l LEFT JOIN ledger_log AS a"
+            "   ON l.op = 'delete' AND a.ledger = l.ledger AND a.op = 'add' AND a.entry_id = l.entry_id"
+            " WHERE l.ledger = ? AND l.seq > ? ORDER BY l.seq LIMIT ?",
+            (ledger_id, since, limit + 1),
+        ).fetchall()
+        more = len(rows) > limit
+        return [_change(r) for r in rows[:limit]], more
+
+    #削除されていない支出を新しい順に limit 件返す（before を渡すとその seq より古いものから）
+    # 戻り値は (支出のリスト, 次のページの before。最後のページなら None)
+    def entries(self, ledger_id, limit=PAGE_SIZE, before=None):
+        rows = self._connect().execute(
+            "SELECT seq, op, entry_id, amount, category, date, time FROM ledger_log AS a"
+            " WHERE a.ledger = ? AND a.op = 'add' AND a.seq < ? AND NOT EXISTS ("
+            "   SELECT 1 FROM ledger_log AS d WHERE d.ledger = a.ledger AND d.op = 'delete' AND d.entry_id = a.entry_id"
+            " ) ORDER BY a.seq DESC LIMIT ?",
+            (ledger_id, before if before is not None else MAX_SEQ, limit + 1),
+        ).fetchall()
+        page = [_change(r) for r in rows[:limit]]
+        return page, page[-1]["seq"] if len(rows) > limit else None
+
+    #一覧の1ページと予算・合計・カーソルを、同じ時点の内容（1つの読み取りトランザクション）で返す
+    def page(self, ledger_id, limit=PAGE_SIZE, before=None):
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            entries, next_before = self.entries(ledger_id, limit, before)
+            return {
+                "entries": entries,
+                "next_before": next_before,
+                "budget": self.budget(ledger_id),
+                "used": self.used(ledger_id),
+                "cursor": self.cursor(ledger_id),
+            }
+        finally:
+            conn.commit()
+
+    def _total(self, ledger_id, kind):
+        row = self._connect().execute(
+            "SELECT amount, count FROM ledger_totals WHERE ledger = ? AND kind = ? AND key = ''",
+            (ledger_id, kind),
+        ).fetchone()
+        return (row["amount"], row["count"]) if row else (0, 0)
+
+    def budget(self, ledger_id):
+        return self._total(ledger_id, "budget")[0]
+
+    def used(self, ledger_id):
+        return self._total(ledger_id, "trip")[0]
+
+    #旅全体・カテゴリ別・日別の合計（集計テーブルを読むだけ）
+    def summary(self, ledger_id):
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            result = {"budget": 0, "used": 0, "count": 0, "categories": [], "days": [], "cursor": self.cursor(ledger_id)}
+            rows = conn.execute(
+                "SELECT kind, key, amount, count FROM ledger_totals WHERE ledger = ?", (ledger_id,)
+            ).fetchall()
+        finally:
+            conn.commit()
+        for row in rows:
+            if row["kind"] == "budget":
+                result["budget"] = row["amount"]
+            elif row["kind"] == "trip":
+                result["used"], result["count"] = row["amount"], row["count"]
+            elif row["count"] > 0:
+                group = "categories" if row["kind"] == "category" else "days"
+                result[group].append({"key": row["key"], "amount": row["amount"], "count": row["count"]})
+        result["categories"].sort(key=lambda c: -c["amount"])
+        result["days"].sort(key=lambda d: d["key"])
+        return result
+
+    def cursor(self, ledger_id):
+        row = self._connect().execute(
+            "SELECT MAX(seq) AS seq FROM ledger_log WHERE ledger = ?", (ledger_id,)
+        ).fetchone()
+        return row["seq"] or 0
+
+
+def _change(row):
+    change = {"seq": row["seq"], "op": row["op"], "id": row["entry_id"]}
+    if row["amount"] is not None:
+        change["amount"] = row["amount"]
+    if row["op"] == "add":
+        change.update(category=row["category"], date=row["date"], time=row["time"])
+    return change
+
+
+def _check_ledger_id(ledger_id):
+    if not _ID_RE.match(ledger_id):
+        return {"error": "invalid ledger id"}, 400
+    return None
+
+
+def init_app(app, ledger=None):
+    ledger = ledger or Ledger()
+    app.extensions["ledger"] = ledger
+
+    #支出の一覧（新しい順、?limit=100&before=<seq> でページ送り）
+    @app.route("/api/ledgers/<ledger_id>/entries", methods=["GET"])
+    def ledger_entries(ledger_id):
+        error = _check_ledger_id(ledger_id)
+        if error:
+            return error
+        limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_CHANGES)
+        before = request.args.get("before", type=int)
+        if before is not None and not 0 <= before <= MAX_SEQ:
+            return {"error": f"before must be between 0 and {MAX_SEQ}"}, 400
+        with metrics.stage("ledger_read"):
+            return ledger.page(ledger_id, limit, before)
+
+    @app.route("/api/ledgers/<ledger_id>/entries", methods=["POST"])
+    def ledger_add(ledger_id):
+        error = _check_ledger_id(ledger_id)
+        if error:
+            return error
+        body = request.get_json(silent=True)
+        change = dict(body if isinstance(body, dict) else {}, op="add")
+        try:
+            with metrics.stage("ledger_write"):
+                ledger.append(ledger_id, [change])
+        except LedgerError as e:
+            return {"error": str(e)}, 400
+        return {"id": change["id"], "cursor": ledger.cursor(ledger_id)}, 201
+
+    @app.route("/api/ledgers/<ledger_id>/entries/<entry_id>", methods=["DELETE"])
+    def ledger_delete(ledger_id, entry_id):
+        error = _check_ledger_id(ledger_id)
+        if error:
+            return error
+        try:
+            with metrics.stage("ledger_write"):
+                ledger.append(ledger_id, [{"op": "delete", "id": entry_id}])
+        except LedgerError as e:
+            return {"error": str(e)}, 400
+        return {"id": entry_id, "cursor": ledger.cursor(ledger_id)}
+
+    #予算・使った合計・カテゴリ別・日別の合計（円グラフと内訳表示用）
+    @app.route("/api/ledgers/<ledger_id>/summary", methods=["GET"])
+    def ledger_summary(ledger_id):
+        error = _check_ledger_id(ledger_id)
+        if error:
+            return error
+        with metrics.stage("ledger_read"):
+            return ledger.summary(ledger_id)
+
+    #クライアントの未送信の変更を受け取り、since より後の変更を返す
+    # リクエスト: {"since": 12, "changes": [{"op": "add", "id": ..., "amount": ...}, ...]}
+    # レスポンス: {"changes": [...], "cursor": 20, "more": false}
+    @app.route("/api/ledgers/<ledger_id>/sync", methods=["POST"])
+    def ledger_sync(ledger_id):
+        error = _check_ledger_id(ledger_id)
+        if error:
+            return error
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            body = {}
+        changes = body.get("changes") or []
+        if not isinstance(changes, list) or len(changes) > MAX_CHANGES:
+            return {"error": f"changes must be a list of at most {MAX_CHANGES} items"}, 400
+        try:
+            since = int(body.get("since") or 0)
+        except (TypeError, ValueError, OverflowError):
+            return {"error": "since must be an integer"}, 400
+        if not 0 <= since <= MAX_SEQ:
+            return {"error": f"since must be between 0 and {MAX_SEQ}"}, 400
+
+        with tracing.span("ledger.sync", received=len(changes), since=since) as span, metrics.stage("ledger_sync"):
+            try:
+                if changes:
+                    ledger.append(ledger_id, changes)
+            except LedgerError as e:
+                return {"error": str(e)}, 400
+            result, more = ledger.changes(ledger_id, since)
+            span.set_attribute("sent", len(result))
+        cursor = result[-1]["seq"] if result else since
+        return {"changes": result, "cursor": cursor, "more": more}
@@ -0,0 +1,242 @@
+#Prometheus テキスト形式のメトリクス
+#
+# app.py / app2.py の両方から使う。外部ライブラリは使わず、
+# Counter と Histogram だけを最小限で実装している。
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, request
+from flask.sessions import SecureCookieSessionInterface
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        return self._values.get(key, 0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            for i, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {row[i]}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(row[-2])}"
+            yield f"{self.name}_count{labels} {row[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help_text}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "app_http_request_duration_seconds",
+    "Flask リクエスト全体の処理時間",
+    ("endpoint", "method", "status"),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "app_stage_duration_seconds",
+    "index() / analyze_receipt 内の各処理段階の時間",
+    ("stage",),
+))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram(
+    "app_upstream_duration_seconds",
+    "外部 API 呼び出しの時間",
+    ("upstream",),
+))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    "app_upstream_requests_total",
+    "外部 API 呼び出し回数（ステータスコード別）",
+    ("upstream", "status"),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "app_cache_requests_total",
+    "キャッシュ参照回数（hit / miss）",
+    ("cache", "result"),
+))
+OPENAI_TOKENS = REGISTRY.register(Counter(
+    "app_openai_tokens_total",
+    "OpenAI レスポンスの usage に含まれるトークン数",
+    ("model", "kind"),
+))
+
+
+#処理段階の時間を計測
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+class _UpstreamCall:
+    def __init__(self):
+        self.status = None
+
+
+#外部 API 呼び出しの時間とステータスを計測
+# with upstream("wikipedia_search") as call:
+#     r = requests.get(...)
+#     call.status = r.status_code
+@contextmanager
+def upstream(name):
+    call = _UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        if call.status is None:
+            response = getattr(e, "response", None)
+            call.status = (
+                getattr(e, "status_code", None)
+                or getattr(response, "status_code", None)
+                or type(e).__name__
+            )
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=name)
+        UPSTREAM_REQUESTS.inc(upstream=name, status=call.status if call.status is not None else "ok")
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_usage(model, usage):
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            OPENAI_TOKENS.inc(value, model=model, kind=kind.replace("_tokens", ""))
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    if cached:
+        OPENAI_TOKENS.inc(cached, model=model, kind="cached_prompt")
+
+
+def render():
+    return REGISTRY.render()
+
+
+#セッション（Cookie）の読み書き時間も計測する
+class TimedSessionInterface(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        with stage("session_load"):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with stage("session_save"):
+            return super().save_session(app, session, response)
+
+
+def init_app(app):
+    app.session_interface = TimedSessionInterface()
+
+    @app.before_request
+    def _start_timer():
+        request.environ["app.start_time"] = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = request.environ.get("app.start_time")
+        if start is not None:
+            HTTP_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or "unknown",
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype=None, content_type=CONTENT_TYPE)
@@ -0,0 +1,211 @@
+#オフライン対応（Service Worker とレシート送信キュー）
+#
+#   /sw.js            : Service Worker。画面（/）と共通スクリプトをキャッシュし、電波がなくてもすぐ開けるようにする。
+#                       キューに入ったレシート画像は Background Sync（sync イベント）で /analyze_receipt に送る。
+#   /receipt-queue.js : 画面と Service Worker の両方で使う IndexedDB のキュー操作。
+#
+# 画面側は送信に失敗したレシートを queueReceipt() でキューに入れ、
+# 結果が届いたら takeReceiptResults() で取り出して金額を登録する（取り出すと消えるので二重登録しない）。
+from flask import Response
+
+
+# スクリプトを変えたらここを上げる（古いキャッシュは activate で消える）
+CACHE_VERSION = "v2"
+
+RECEIPT_QUEUE_JS = r"""
+// レシート送信キュー（IndexedDB）
+//   queue   : まだ解析できていない画像 { id, blob, createdAt }
+//   results : 解析できた結果 { id, data, createdAt }（画面が金額を登録したら消す）
+const RECEIPT_DB = "receipt-queue";
+const RECEIPT_SYNC_TAG = "receipt-upload";
+
+function openReceiptDb() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(RECEIPT_DB, 1);
+    req.onupgradeneeded = () => {
+      req.result.createObjectStore("queue", { keyPath: "id" });
+      req.result.createObjectStore("results", { keyPath: "id" });
+    };
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+function receiptTx(store, mode, fn) {
+  return openReceiptDb().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction(store, mode);
+    const result = fn(tx.objectStore(store));
+    tx.oncomplete = () => { db.close(); resolve(result && "result" in result ? result.result : result); };
+    tx.onerror = () => { db.close(); reject(tx.error); };
+  }));
+}
+
+function queueReceipt(blob) {
+  const item = { id: `${Date.now()}-${Math.random().toString(36).slice(2, 10)}`, blob, createdAt: Date.now() };
+  return receiptTx("queue", "readwrite", (store) => store.put(item)).then(() => item.id);
+}
+
+function queuedReceipts() {
+  return receiptTx("queue", "readonly", (store) => store.getAll());
+}
+
+function receiptQueueSize() {
+  return receiptTx("queue", "readonly", (store) => store.count());
+}
+
+// 1件送る。成功したら結果を results に移してキューから消す
+async function uploadQueuedReceipt(item) {
+  const formData = new FormData();
+  formData.append("image", item.blob, "receipt");
+  const res = await fetch("/analyze_receipt", { method: "POST", body: formData });
+  if (res.status === 413) {
+    // 何度送っても通らないので捨てる
+    await receiptTx("queue", "readwrite", (store) => store.delete(item.id));
+    return;
+  }
+  if (!res.ok) throw new Error(`analyze_receipt failed: ${res.status}`);
+  const data = await res.json();
+
+  const db = await openReceiptDb();
+  await new Promise((resolve, reject) => {
+    const tx = db.transaction(["queue", "results"], "readwrite");
+    tx.objectStore("results").put({ id: item.id, data, createdAt: item.createdAt });
+    tx.objectStore("queue").delete(item.id);
+    tx.oncomplete = resolve;
+    tx.onerror = () => reject(tx.error);
+  });
+  db.close();
+}
+
+// キューを全部送る（失敗したものは残して例外を投げ、Background Sync に再試行させる）
+async function flushReceiptQueue() {
+  let failed = 0;
+  for (const item of await queuedReceipts()) {
+    try {
+      await uploadQueuedReceipt(item);
+    } catch (e) {
+      failed += 1;
+    }
+  }
+  if (failed) throw new Error(`${failed} receipt(s) still queued`);
+}
+
+// 届いた結果を取り出して消す（同じ結果を2回登録しないよう、読むのと消すのを1つのトランザクションで行う）
+function takeReceiptResults() {
+  return openReceiptDb().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction("results", "readwrite");
+    const store = tx.objectStore("results");
+    const req = store.getAll();
+    req.onsuccess = () => store.clear();
+    tx.oncomplete = () => { db.close(); resolve(req.result.sort((a, b) => a.createdAt - b.createdAt)); };
+    tx.onerror = () => { db.close(); reject(tx.error); };
+  }));
+}
+"""
+
+SERVICE_WORKER_JS = r"""
+importScripts("/receipt-queue.js");
+
+const SHELL_CACHE = "shell-__VERSION__";
+const IMAGE_CACHE = "images-__VERSION__";
+const SHELL_URLS = ["/", "/receipt-queue.js", "/receipt-image-worker.js"];
+// 画面はまずネットワークから取り、これ以上待つならキャッシュを出す
+const NETWORK_TIMEOUT_MS = 2500;
+const MAX_IMAGES = 60;
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(caches.open(SHELL_CACHE).then((cache) => cache.addAll(SHELL_URLS)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((k) => k !== SHELL_CACHE && k !== IMAGE_CACHE).map((k) => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+function networkFirst(request, cacheKey) {
+  return new Promise((resolve) => {
+    let settled = false;
+    const fallback = () => caches.match(cacheKey || request).then((cached) => cached);
+    const timer = setTimeout(() => {
+      fallback().then((cached) => {
+        if (cached && !settled) { settled = true; resolve(cached); }
+      });
+    }, NETWORK_TIMEOUT_MS);
+
+    fetch(request).then((response) => {
+      clearTimeout(timer);
+      if (response.ok) {
+        const copy = response.clone();
+        caches.open(SHELL_CACHE).then((cache) => cache.put(cacheKey || request, copy));
+      }
+      if (!settled) { settled = true; resolve(response); }
+    }).catch(() => {
+      clearTimeout(timer);
+      fallback().then((cached) => {
+        if (!settled) { settled = true; resolve(cached || Response.error()); }
+      });
+    });
+  });
+}
+
+async function cacheFirstImage(request) {
+  const cache = await caches.open(IMAGE_CACHE);
+  const cached = await cache.match(request);
+  if (cached) return cached;
+  const response = await fetch(request);
+  cache.put(request, response.clone());
+  const keys = await cache.keys();
+  if (keys.length > MAX_IMAGES) await cache.delete(keys[0]);
+  return response;
+}
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") return;
+  const url = new URL(request.url);
+
+  if (request.mode === "navigate" && url.origin === location.origin && url.pathname === "/") {
+    // 共有URLなどクエリ付きで開いたときも、オフラインなら同じ画面を出す
+    event.respondWith(networkFirst(request, url.search ? "/" : undefined));
+  } else if (url.origin === location.origin && SHELL_URLS.includes(url.pathname)) {
+    event.respondWith(networkFirst(request));
+  } else if (request.destination === "image" && url.hostname.endsWith("wikimedia.org")) {
+    event.respondWith(cacheFirstImage(request));
+  }
+});
+
+async function notifyClients() {
+  const clients = await self.clients.matchAll({ type: "window" });
+  clients.forEach((client) => client.postMessage({ type: "receipt-results" }));
+}
+
+self.addEventListener("sync", (event) => {
+  if (event.tag === RECEIPT_SYNC_TAG) {
+    event.waitUntil(flushReceiptQueue().finally(notifyClients));
+  }
+});
+
+// Background Sync がないブラウザでは画面から頼まれたときに送る
+self.addEventListener("message", (event) => {
+  if (event.data && event.data.type === "flush-receipts") {
+    event.waitUntil(flushReceiptQueue().catch(() => {}).finally(notifyClients));
+  }
+});
+""".replace("__VERSION__", CACHE_VERSION)
+
+
+def init_app(app):
+    @app.route("/sw.js")
+    def service_worker():
+        return Response(
+            SERVICE_WORKER_JS,
+            mimetype="application/javascript",
+            headers={"Cache-Control": "no-cache", "Service-Worker-Allowed": "/"},
+        )
+
+    @app.route("/receipt-queue.js")
+    def receipt_queue_js():
+        return Response(RECEIPT_QUEUE_JS, mimetype="application/javascript", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,169 @@
+#旅行先の表記ゆれをまとめる
+#
+# 京都 / 京都府 / 京都市 / きょうと / kyoto などを同じ正規名「京都」に寄せ、
+# 検索キャッシュやプランのキャッシュのキーに使う。
+#   1. NFKC 正規化・カタカナ→ひらがな・ローマ字の長音をそろえる
+#   2. 辞書の別名と完全一致するか見る（「府」「県」「市」や「観光」「旅行」を外しても見る）
+#   3. 一致しなければ文字 bigram の Dice 係数で一番近い別名を探す（ネットワークは使わない）
+#      短い入力（nago / ota など）は別の地名と似てしまうので、完全一致・別名だけで判定する
+# どれにも当たらない地名は入力の表記のまま（「観光」などだけ外して）返す。
+import re
+import unicodedata
+
+from cache import MISSING, LRUCache
+
+
+# (正規名, ひらがな読み, ローマ字)
+PLACES = (
+    ("北海道", "ほっかいどう", "hokkaido"), ("青森", "あおもり", "aomori"), ("岩手", "いわて", "iwate"),
+    ("宮城", "みやぎ", "miyagi"), ("秋田", "あきた", "akita"), ("山形", "やまがた", "yamagata"),
+    ("福島", "ふくしま", "fukushima"), ("茨城", "いばらき", "ibaraki"), ("栃木", "とちぎ", "tochigi"),
+    ("群馬", "ぐんま", "gunma"), ("埼玉", "さいたま", "saitama"), ("千葉", "ちば", "chiba"),
+    ("東京", "とうきょう", "tokyo"), ("神奈川", "かながわ", "kanagawa"), ("新潟", "にいがた", "niigata"),
+    ("富山", "とやま", "toyama"), ("石川", "いしかわ", "ishikawa"), ("福井", "ふくい", "fukui"),
+    ("山梨", "やまなし", "yamanashi"), ("長野", "ながの", "nagano"), ("岐阜", "ぎふ", "gifu"),
+    ("静岡", "しずおか", "shizuoka"), ("愛知", "あいち", "aichi"), ("三重", "みえ", "mie"),
+    ("滋賀", "しが", "shiga"), ("京都", "きょうと", "kyoto"), ("大阪", "おおさか", "osaka"),
+    ("兵庫", "ひょうご", "hyogo"), ("奈良", "なら", "nara"), ("和歌山", "わかやま", "wakayama"),
+    ("鳥取", "とっとり", "tottori"), ("島根", "しまね", "shimane"), ("岡山", "おかやま", "okayama"),
+    ("広島", "ひろしま", "hiroshima"), ("山口", "やまぐち", "yamaguchi"), ("徳島", "とくしま", "tokushima"),
+    ("香川", "かがわ", "kagawa"), ("愛媛", "えひめ", "ehime"), ("高知", "こうち", "kochi"),
+    ("福岡", "ふくおか", "fukuoka"), ("佐賀", "さが", "saga"), ("長崎", "ながさき", "nagasaki"),
+    ("熊本", "くまもと", "kumamoto"), ("大分", "おおいた", "oita"), ("宮崎", "みやざき", "miyazaki"),
+    ("鹿児島", "かごしま", "kagoshima"), ("沖縄", "おきなわ", "okinawa"),
+    # 都道府県名と違う主な観光地
+    ("札幌", "さっぽろ", "sapporo"), ("函館", "はこだて", "hakodate"), ("小樽", "おたる", "otaru"),
+    ("仙台", "せんだい", "sendai"), ("日光", "にっこう", "nikko"), ("横浜", "よこはま", "yokohama"),
+    ("鎌倉", "かまくら", "kamakura"), ("箱根", "はこね", "hakone"), ("熱海", "あたみ", "atami"),
+    ("軽井沢", "かるいざわ", "karuizawa"), ("金沢", "かなざわ", "kanazawa"), ("高山", "たかやま", "takayama"),
+    ("名古屋", "なごや", "nagoya"), ("伊勢", "いせ", "ise"), ("神戸", "こうべ", "kobe"),
+    ("姫路", "ひめじ", "himeji"), ("倉敷", "くらしき", "kurashiki"), ("宮島", "みやじま", "miyajima"),
+    ("松山", "まつやま", "matsuyama"), ("別府", "べっぷ", "beppu"), ("那覇", "なは", "naha"),
+    ("石垣島", "いしがきじま", "ishigaki"),
+)
+
+# 「京都府」「京都市」のような別名は自動で作るので、それ以外の別名だけ書く
+EXTRA_ALIASES = {
+    "東京": ("東京都", "tokyo to"),
+    "北海道": ("hokkaido prefecture",),
+}
+
+ADMIN_SUFFIXES = ("都", "道", "府", "県", "市", "区", "町", "村")
+TRIP_WORDS = ("観光", "旅行", "周辺", "市内", "エリア", "駅", "旅")
+ROMAJI_SUFFIXES = (" prefecture", " city", "-ken", "-fu", "-shi", " ken", " fu", " shi")
+
+# これ以上似ていれば同じ場所とみなす（hokaido / kyotto のような打ち間違いは 0.8 以上になる）
+SIMILARITY_THRESHOLD = 0.75
+# これより短い入力は似ている別名を探さない
+MIN_FUZZY_LENGTH = 5
+
+_canonical_cache = LRUCache("place_canonical", maxsize=10000)
+
+
+def _to_hiragana(text):
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+def _romaji(text):
+    for suffix in ROMAJI_SUFFIXES:
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+    text = re.sub(r"[\s\-_'.]+", "", text)
+    # kyouto / kyooto / tookyoo → kyoto / tokyo
+    text = text.replace("ou", "o").replace("oo", "o").replace("uu", "u").replace("aa", "a")
+    return text
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").strip().lower()
+    text = _to_hiragana(text)
+    if text.isascii():
+        return _romaji(text)
+    return re.sub(r"\s+", "", text)
+
+
+def _bigrams(text):
+    padded = f"^{text}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _build_index():
+    aliases = {}
+    for name, kana, romaji in PLACES:
+        forms = [name, kana, romaji, *EXTRA_ALIASES.get(name, ())]
+        forms += [name + suffix for suffix in ADMIN_SUFFIXES[2:5]]
+        for form in forms:
+            aliases.setdefault(normalize(form), name)
+    # bigram -> その bigram を含む別名（似ている候補だけを比べるための転置インデックス）
+    inverted = {}
+    grams = {}
+    for alias in aliases:
+        grams[alias] = _bigrams(alias)
+        for g in grams[alias]:
+            inverted.setdefault(g, []).append(alias)
+    return aliases, grams, inverted
+
+
+_ALIASES, _ALIAS_GRAMS, _INVERTED = _build_index()
+
+
+def _strip_words(text):
+    changed = True
+    while changed:
+        changed = False
+        for word in TRIP_WORDS:
+            if text.endswith(word) and len(text) > len(word):
+                text = text[:-len(word)]
+                changed = True
+    return text
+
+
+def _lookup(text):
+    if text in _ALIASES:
+        return _ALIASES[text]
+    stripped = _strip_words(text)
+    if stripped in _ALIASES:
+        return _ALIASES[stripped]
+    for suffix in ADMIN_SUFFIXES:
+        if stripped.endswith(suffix) and stripped[:-len(suffix)] in _ALIASES:
+            return _ALIASES[stripped[:-len(suffix)]]
+    return None
+
+
+#一番似ている別名の正規名と類似度を返す
+def nearest(text):
+    grams = _bigrams(text)
+    best, best_score = None, 0.0
+    seen = set()
+    for g in grams:
+        for alias in _INVERTED.get(g, ()):
+            if alias in seen:
+                continue
+            seen.add(alias)
+            other = _ALIAS_GRAMS[alias]
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score > best_score:
+                best, best_score = _ALIASES[alias], score
+    return best, best_score
+
+
+#旅行先の入力を正規名にする（キャッシュのキーや検索語に使う）
+def canonical(destination):
+    text = normalize(destination)
+    if not text:
+        return text
+    cached = _canonical_cache.get(text)
+    if cached is not MISSING:
+        return cached
+
+    name = _lookup(text)
+    if name is None:
+        stripped = _strip_words(text)
+        candidate, score = nearest(stripped) if len(stripped) >= MIN_FUZZY_LENGTH else (None, 0.0)
+        if candidate is not None and score >= SIMILARITY_THRESHOLD:
+            name = candidate
+        else:
+            # 辞書にない地名は入力の表記のまま（全角・半角と「観光」などだけそろえる）
+            name = _strip_words(unicodedata.normalize("NFKC", destination).strip())
+    _canonical_cache.set(text, name)
+    return name
@@ -0,0 +1,134 @@
+#本番リクエスト用のサンプリングプロファイラー
+#
+# index() / analyze_receipt に @profiler.profiled を付けると、
+# 次のどちらかの場合だけそのリクエストをプロファイルする。
+#   - PROFILE_SAMPLE_RATE（0.0〜1.0、デフォルト 0）の確率で当たったとき
+#   - X-Profile ヘッダーが PROFILE_TOKEN と一致したとき（PROFILE_TOKEN 未設定なら無効）
+# 別スレッドが PROFILE_INTERVAL_MS ごとにリクエスト処理スレッドのスタックを覗き、
+# flamegraph.pl / speedscope でそのまま読める folded 形式で PROFILE_DIR に書き出す。
+# 同時にプロファイルするリクエスト数は PROFILE_MAX_CONCURRENT で制限する。
+import functools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import request
+
+import tracing
+
+
+PROFILE_HEADER = "X-Profile"
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+SAMPLE_RATE = _env_float("PROFILE_SAMPLE_RATE", 0.0)
+INTERVAL = _env_float("PROFILE_INTERVAL_MS", 5.0) / 1000.0
+OUTPUT_DIR = os.environ.get("PROFILE_DIR", "profiles")
+TOKEN = os.environ.get("PROFILE_TOKEN", "")
+MAX_CONCURRENT = int(_env_float("PROFILE_MAX_CONCURRENT", 2))
+
+_slots = threading.BoundedSemaphore(max(MAX_CONCURRENT, 1))
+
+
+def _frame_label(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _should_profile():
+    if TOKEN and request.headers.get(PROFILE_HEADER) == TOKEN:
+        return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+#書き出し先のパス。リクエストIDに使えない文字があれば除き、PROFILE_DIR の外を指していないか確かめる
+def _output_path(view_name):
+    rid = re.sub(r"[^A-Za-z0-9_-]", "", tracing.current_request_id())[:64] or "-"
+    name = os.path.basename(f"{time.strftime('%Y%m%d-%H%M%S')}-{view_name}-{rid}.folded")
+    root = os.path.realpath(OUTPUT_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.dirname(path) != root:
+        raise OSError(f"profile path outside {OUTPUT_DIR}: {name}")
+    return path
+
+
+#ビュー関数をサンプリングプロファイラーで包む
+def profiled(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _should_profile() or not _slots.acquire(blocking=False):
+            return view(*args, **kwargs)
+
+        start = time.perf_counter()
+        sampler = Sampler(threading.get_ident()).start()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            sampler.stop()
+            _slots.release()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            try:
+                path = sampler.write_folded(_output_path(view.__name__))
+                logger.info("profile written: %s (%d samples, %.1f ms)", path, sampler.samples, elapsed_ms)
+            except OSError:
+                logger.exception("failed to write profile")
+
+    return wrapper
@@ -0,0 +1,141 @@
+#お土産提案のプロンプト
+#
+# 毎回同じになる部分（役割・ルール・出力形式）は起動時に1回だけ組み立てて system メッセージにし、
+# リクエストごとに変わる【条件】だけを user メッセージにする。
+# （プロンプト全体で 400 トークンほどなので OpenAI の prompt caching（1024 トークン以上）は効かない。減らしているのは組み立ての手間と送るトークン数）
+#
+# 【条件】には空欄・「気にしない」の項目を入れない。ジャンルが食べ物でなければ日持ち・アレルギーも入れない。
+# トークン数は tiktoken があればそれで数え、なければ文字種からの概算を使う。
+# tiktoken の読み込み（エンコーディングの表の読み込み）は重いので、最初に数えるときまで遅らせる。
+# 合計が上限を超えそうなときは優先度の低い条件から外し、最後は旅行先の文字列を切り詰める。
+import logging
+import os
+
+
+MAX_PROMPT_TOKENS = int(os.environ.get("SOUVENIR_PROMPT_MAX_TOKENS", 600))
+# hidden input なので長い文字列を送られることもある
+MAX_FIELD_CHARS = 40
+
+# 「指定なし」とみなす値
+SKIP_VALUES = ("", "気にしない", "どちらでも", "どれでもOK")
+FOOD_GENRES = ("お菓子", "和菓子", "洋菓子", "食品", "飲み物", "どれでもOK")
+
+# (フォームの name, 見出し)。上にあるものほど優先度が高い（予算超過時は下から外す）
+CONDITIONS = (
+    ("place", "旅行先"),
+    ("genre", "ジャンル"),
+    ("budget", "予算"),
+    ("target", "誰向け"),
+    ("package", "個包装"),
+    ("shelf", "日持ち"),
+    ("allergy", "アレルギー配慮"),
+)
+FOOD_ONLY = ("shelf", "allergy")
+
+SOUVENIR_SYSTEM = """あなたは日本のお土産に詳しい専門家です。
+
+【ルール】
+ユーザーが示す【条件】に合う「日本の伝統的・一般的なお土産」を選び、
+**Wikipediaに単独ページがある名称のみ**を使って、
+以下の形式で書いてください。
+- 【条件】に書かれていない項目は考慮しなくて構いません
+- 予算内で現実的に購入できるものを選んでください
+- 日本の一般的・伝統的なお土産に限定してください
+- Wikipediaに単独ページが存在する名称のみを使用してください
+- Wikipediaに単独ページが存在するという内容は書かないでください。
+- 敬語で書いてください
+- 一つのお土産に対して4行以上の文章で書いてください。
+- どこで売っているかも書いてください。
+
+【出力形式】
+以下の形式で{count}つ提案してください。
+
+{lines}
+"""
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+        except ImportError:
+            _encoding = False
+        else:
+            # エンコーディングの表は初回にダウンロードされるので、オフラインなどで取れなければ概算に切り替える
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                logger.warning("tiktoken: cannot load o200k_base, falling back to the estimate", exc_info=True)
+                _encoding = False
+    return _encoding
+
+
+#トークン数を数える（tiktoken がなければ概算：ASCII は4文字で1、それ以外は1文字で1）
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class SouvenirPrompt:
+    def __init__(self, count, max_tokens=MAX_PROMPT_TOKENS):
+        lines = "\n".join(f"{i}. お土産名：条件に合っている理由が分かる説明" for i in range(1, count + 1))
+        self.count = count
+        self.max_tokens = max_tokens
+        self.system = SOUVENIR_SYSTEM.format(count=count, lines=lines)
+        self._system_tokens = None
+
+    @property
+    def system_tokens(self):
+        if self._system_tokens is None:
+            self._system_tokens = count_tokens(self.system)
+            if self._system_tokens >= self.max_tokens:
+                logger.warning("souvenir prompt: static part (%d tokens) exceeds budget %d",
+                               self._system_tokens, self.max_tokens)
+        return self._system_tokens
+
+    #フォームの値から【条件】の (見出し, 値) のリストを作る
+    def conditions(self, form):
+        genre = (form.get("genre") or "").strip()
+        items = []
+        for name, label in CONDITIONS:
+            value = (form.get(name) or "").strip()[:MAX_FIELD_CHARS]
+            if value in SKIP_VALUES:
+                continue
+            if name in FOOD_ONLY and genre and genre not in FOOD_GENRES:
+                continue
+            items.append((label, value))
+        return items
+
+    def _user(self, items):
+        return "【条件】\n" + "\n".join(f"{label}：{value}" for label, value in items)
+
+    #OpenAI に渡す messages と、数えたトークン数を返す
+    def build(self, form):
+        items = self.conditions(form)
+        user = self._user(items)
+        tokens = self.system_tokens + count_tokens(user)
+
+        # 上限を超えるなら優先度の低い条件から外す（最優先の1つだけは残す）
+        while tokens > self.max_tokens and len(items) > 1:
+            items.pop()
+            user = self._user(items)
+            tokens = self.system_tokens + count_tokens(user)
+        while tokens > self.max_tokens and items and len(items[0][1]) > 1:
+            label, value = items[0]
+            items[0] = (label, value[:len(value) // 2])
+            user = self._user(items)
+            tokens = self.system_tokens + count_tokens(user)
+
+        messages = [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": user},
+        ]
+        return messages, tokens
@@ -0,0 +1,291 @@
+#レシート画像の前処理（ブラウザ側）とアップロードの受け取り・金額の読み取り（サーバー側）
+#
+#   /receipt-image-worker.js : Web Worker。カメラの画像を長辺 MAX_EDGE px までに縮め、
+#                              WebP（使えなければ JPEG）で書き出し直してから返す。
+#   POST /analyze_receipt    : レシート画像から合計金額を読み取る。
+#
+# 書き出し直すので EXIF（位置情報・撮影機器など）は残らない。向きは createImageBitmap が EXIF を見て直す。
+# スマホの写真（4000px 前後・数MB）が 200KB 前後になり、アップロードとサーバー側のデコードが軽くなる。
+# 1600px あればレシートの数字は読める（OpenAI 側でも長辺 2048px までに縮められる）。
+#
+# サーバー側ではアップロードを丸ごとメモリに読まない。
+#   - RECEIPT_MAX_BYTES を超えるリクエストは読む前に 413 で断る
+#   - アップロードは SPOOL_BYTES を超えたら一時ファイルに書き出す（SpoolingRequest）
+#   - base64 はチャンクごとに、最終的な data URL の大きさで確保したバッファへ直接書き込む
+# 以前は「元の bytes・base64 の bytes・str・data URL の f-string」と画像の約5倍を持っていたが、
+# いまはバッファと str の2つ（base64 なので画像の約2.7倍）だけになる。
+#
+# 読み取り結果は JSON Schema（Structured Outputs）で {amount, currency, confidence, line} を返させ、
+# サーバー側でも検証する。検証に通らなかったときだけ、理由を添えて聞き直す（MAX_ATTEMPTS 回まで）。
+# 外国のレシートは with_yen() で通貨を行の表記と突き合わせ、手元のレート表（currency.py）で円に換算する。
+import base64
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+
+from flask import Request, Response, request
+
+import clients
+import currency
+import metrics
+import profiler
+import tracing
+
+
+MAX_EDGE = 1600
+WEBP_QUALITY = 0.8
+JPEG_QUALITY = 0.82
+
+MAX_UPLOAD_BYTES = int(os.environ.get("RECEIPT_MAX_BYTES", 10 * 1024 * 1024))
+SPOOL_BYTES = 64 * 1024
+# 3 の倍数にしておくと、チャンクごとの base64 をつなげても途中に "=" が入らない
+CHUNK_BYTES = 3 * 64 * 1024
+
+MAX_ATTEMPTS = 2
+
+RECEIPT_MIMETYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+RECEIPT_PROMPT = (
+    "このレシート画像から、「合計」「お支払額」「ご請求額」「TOTAL」と書かれている行を探してください。"
+    "その中で支払った「税込の合計金額」を1つだけ読み取ってください。"
+    "小計、税抜金額、内税、消費税額、ポイント利用額、預かり金、釣り銭は無視してください。\n"
+    "amount: 合計金額の数値（桁区切りや通貨記号は含めない。読み取れなければ null）\n"
+    "currency: 通貨の ISO 4217 コード（円なら JPY。通貨記号や店の所在地から判断する）\n"
+    "confidence: 読み取りの確かさ（0〜1）\n"
+    "line: 金額を読み取った行をレシートの表記のまま"
+)
+
+RECEIPT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "amount": {"type": ["number", "null"]},
+        "currency": {"type": "string"},
+        "confidence": {"type": "number"},
+        "line": {"type": "string"},
+    },
+    "required": ["amount", "currency", "confidence", "line"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "receipt_total", "strict": True, "schema": RECEIPT_SCHEMA},
+}
+
+RECEIPT_INVALID = metrics.REGISTRY.register(metrics.Counter(
+    "app_receipt_invalid_total",
+    "検証に通らなかったレシートの読み取り結果（理由別）",
+    ("reason",),
+))
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidReceipt(ValueError):
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+IMAGE_WORKER_JS = r"""
+const MAX_EDGE = __MAX_EDGE__;
+const WEBP_QUALITY = __WEBP_QUALITY__;
+const JPEG_QUALITY = __JPEG_QUALITY__;
+
+async function encode(canvas) {
+  // WebP に対応していないと PNG で返ってくるので、そのときは JPEG にする
+  const webp = await canvas.convertToBlob({ type: "image/webp", quality: WEBP_QUALITY });
+  if (webp.type === "image/webp") return webp;
+  return canvas.convertToBlob({ type: "image/jpeg", quality: JPEG_QUALITY });
+}
+
+async function compress(file) {
+  const bitmap = await createImageBitmap(file, { imageOrientation: "from-image" });
+  const scale = Math.min(1, MAX_EDGE / Math.max(bitmap.width, bitmap.height));
+  const width = Math.max(1, Math.round(bitmap.width * scale));
+  const height = Math.max(1, Math.round(bitmap.height * scale));
+
+  const canvas = new OffscreenCanvas(width, height);
+  const ctx = canvas.getContext("2d");
+  // 透過 PNG の背景が黒くならないように白で塗っておく
+  ctx.fillStyle = "#fff";
+  ctx.fillRect(0, 0, width, height);
+  ctx.imageSmoothingQuality = "high";
+  ctx.drawImage(bitmap, 0, 0, width, height);
+  bitmap.close();
+  return encode(canvas);
+}
+
+self.onmessage = async (event) => {
+  const { id, file } = event.data;
+  try {
+    const blob = await compress(file);
+    self.postMessage({ id, blob });
+  } catch (e) {
+    self.postMessage({ id, error: String(e) });
+  }
+};
+""".replace("__MAX_EDGE__", str(MAX_EDGE)) \
+    .replace("__WEBP_QUALITY__", str(WEBP_QUALITY)) \
+    .replace("__JPEG_QUALITY__", str(JPEG_QUALITY))
+
+
+#アップロードされたファイルを SPOOL_BYTES までメモリ、それ以上は一時ファイルに置く
+class SpoolingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode="rb+")
+
+
+def _read_chunk(stream, size):
+    chunk = stream.read(size)
+    # ソケットなどは短く返すことがあるので、3 の倍数になるまで読み足す
+    while chunk and len(chunk) < size:
+        more = stream.read(size - len(chunk))
+        if not more:
+            break
+        chunk += more
+    return chunk
+
+
+#ファイルを data URL（data:<mimetype>;base64,...）にする。(data URL, 元の大きさ) を返す
+def image_data_url(stream, mimetype):
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+
+    prefix = f"data:{mimetype};base64,".encode("ascii")
+    buf = bytearray(len(prefix) + 4 * ((size + 2) // 3))
+    view = memoryview(buf)
+    view[:len(prefix)] = prefix
+    pos = len(prefix)
+    while True:
+        chunk = _read_chunk(stream, CHUNK_BYTES)
+        if not chunk:
+            break
+        encoded = base64.b64encode(chunk)
+        view[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    view.release()
+    del buf[pos:]
+    return buf.decode("ascii"), size
+
+
+#行に書かれている数値を取り出す
+# 「,」「.」は国によって桁区切りにも小数点にもなる（1,234.50 / 1.234,50 / 12,50 € / 1.234.000 ₫）ので、
+# 桁区切りが3桁ごとになっている読み方をどちらも候補にする（「1,234」は 1234 と 1.234）
+def _numbers(text):
+    numbers = set()
+    for token in re.findall(r"\d(?:[\d.,]*\d)?", text):
+        for thousands, decimal in ((",", "."), (".", ",")):
+            m = re.fullmatch(rf"(\d{{1,3}}(?:\{thousands}\d{{3}})+|\d+)(?:\{decimal}(\d+))?", token)
+            if m:
+                numbers.add(float(m.group(1).replace(thousands, "") + "." + (m.group(2) or "0")))
+    return numbers
+
+
+#モデルの回答（JSON 文字列）を検証して dict にする。おかしければ InvalidReceipt
+def parse_receipt(text):
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        raise InvalidReceipt("json", "JSON として読めません")
+    if not isinstance(data, dict) or set(data) != set(RECEIPT_SCHEMA["required"]):
+        raise InvalidReceipt("schema", "amount / currency / confidence / line の4項目で答えてください")
+
+    amount, currency, confidence, line = data["amount"], data["currency"], data["confidence"], data["line"]
+    if not isinstance(line, str) or not isinstance(currency, str):
+        raise InvalidReceipt("schema", "currency と line は文字列で答えてください")
+    currency = currency.strip().upper()
+    if not re.fullmatch(r"[A-Z]{3}", currency):
+        raise InvalidReceipt("currency", f"currency「{currency}」は ISO 4217 の3文字のコードではありません")
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        raise InvalidReceipt("confidence", "confidence は 0〜1 の数値で答えてください")
+
+    if amount is not None:
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount <= 0:
+            raise InvalidReceipt("amount", f"amount「{amount}」は正の数値ではありません")
+        # 「1,234円（税込）2」のような行から余計な数字を拾っていないか、行の数値のどれかと一致するか見る
+        numbers = _numbers(line)
+        if numbers and not any(math.isclose(amount, n, abs_tol=0.005) for n in numbers):
+            raise InvalidReceipt("line", f"amount「{amount}」が line「{line}」の金額と一致しません")
+
+    return {
+        "amount": amount,
+        "currency": currency,
+        "confidence": round(float(confidence), 3),
+        "line": line.strip(),
+    }
+
+
+def receipt_messages(image_url):
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": RECEIPT_PROMPT},
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ],
+    }]
+
+
+#complete(messages) で読み取り、検証に通った結果を返す
+# 通らなければ、前の回答と理由を会話に足して聞き直す。最後まで通らなければ amount=None を返す。
+def extract(complete, image_url):
+    messages = receipt_messages(image_url)
+    for attempt in range(MAX_ATTEMPTS):
+        text = complete(messages)
+        try:
+            return parse_receipt(text)
+        except InvalidReceipt as e:
+            RECEIPT_INVALID.inc(reason=e.reason)
+            logger.info("receipt: invalid answer (attempt %d): %s: %r", attempt + 1, e, text)
+            messages = messages + [
+                {"role": "assistant", "content": text or ""},
+                {"role": "user", "content": f"前の回答は不正です：{e}。もう一度、指定の形式で答えてください。"},
+            ]
+    return {"amount": None, "currency": "JPY", "confidence": 0.0, "line": ""}
+
+
+#通貨を行の表記と突き合わせ、円に換算した金額（amount_jpy）と使ったレート（rate）を足す
+# 換算できない通貨なら amount_jpy は None
+def with_yen(result):
+    detected = currency.detect(result["line"])
+    if detected is not None and detected != result["currency"]:
+        logger.info("receipt: currency %s overridden by line %r", result["currency"], result["line"])
+        result = {**result, "currency": detected}
+    return {
+        **result,
+        "amount_jpy": currency.to_jpy(result["amount"], result["currency"]),
+        "rate": currency.rate(result["currency"]),
+    }
+
+
+def init_app(app):
+    app.request_class = SpoolingRequest
+
+    @app.route("/analyze_receipt", methods=["POST"])
+    @profiler.profiled
+    def analyze_receipt():
+        # 大きすぎるものは本文を読む前に 413 で断る
+        request.max_content_length = MAX_UPLOAD_BYTES
+        file = request.files["image"]
+        # ブラウザ側で WebP / JPEG にしてから送られてくる（古いブラウザやキューからは元の形式のまま）
+        mimetype = file.mimetype if file.mimetype in RECEIPT_MIMETYPES else "image/jpeg"
+        with tracing.span("encode_image") as span, metrics.stage("encode_image"):
+            image_url, size = image_data_url(file.stream, mimetype)
+            span.set_attribute("image.bytes", size)
+
+        def complete(messages):
+            with metrics.stage("vision_completion"):
+                text, model = clients.chat(
+                    "receipt", messages, span="openai.vision", upstream="openai_vision",
+                    response_format=RESPONSE_FORMAT, max_tokens=120,
+                )
+            return text
+
+        return with_yen(extract(complete, image_url))
+
+    @app.route("/receipt-image-worker.js")
+    def receipt_image_worker_js():
+        return Response(IMAGE_WORKER_JS, mimetype="application/javascript", headers={"Cache-Control": "no-cache"})
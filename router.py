@@ -0,0 +1,239 @@
+#タスクごとの LLM モデル選択
+#
+# タスク（souvenir / receipt）ごとに候補モデルを並べておき、直近の実測値
+# （レイテンシの p50 / p90、エラー率）と料金からスコアを付けて一番よいモデルを使う。
+# 実測がまだ少ないモデルは設定した目安のレイテンシで評価する。
+#
+#   ROUTER.call("souvenir", lambda model: client.chat.completions.create(model=model, ...), hedge=True)
+#
+# hedge=True のときは、1つ目のモデルが自分の p90 を過ぎても返ってこなければ
+# 2番目のモデルにも同じリクエストを投げ、先に返ってきた方を使う（遅い方は裏で最後まで走らせ、実測に使う）。
+# 1つ目は待ち行列に入れずにすぐ投げ、2つ目（ヘッジ）だけを HEDGE_WORKERS 本のプールから投げる。
+# プールが埋まっているときや、ヘッジの予算（呼び出し数の HEDGE_BUDGET 割合）を使い切ったときはヘッジしない。
+# ヘッジできないときは1つ目を呼び出し元のスレッドでそのまま呼ぶ。
+# 失敗したときは次のモデルで投げ直す。
+#
+# 候補は MODEL_ROUTES で上書きできる: "souvenir=gpt-4.1-mini,gpt-4o-mini;receipt=gpt-4o-mini;enrich=gpt-4.1-mini"
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import metrics
+
+
+# モデル名 -> (入力 100万トークンあたりのドル, 出力 100万トークンあたりのドル, 目安のレイテンシ秒)
+MODELS = {
+    "gpt-4.1-mini": (0.40, 1.60, 6.0),
+    "gpt-4.1-nano": (0.10, 0.40, 4.0),
+    "gpt-4o-mini": (0.15, 0.60, 6.0),
+}
+
+DEFAULT_ROUTES = {
+    "souvenir": ("gpt-4.1-mini", "gpt-4o-mini"),
+    "receipt": ("gpt-4o-mini", "gpt-4.1-mini"),
+    # スポット説明文（enrich.py）
+    "enrich": (os.environ.get("ENRICH_MODEL", "gpt-4.1-mini"),),
+}
+
+WINDOW = 200
+MIN_SAMPLES = 10
+# エラー率 1 あたりレイテンシを何倍に見るか
+ERROR_PENALTY = 5.0
+# 料金 1 ドル / 100万トークンあたり何秒とみなすか（小さいほど速さ優先）
+# 実測が MIN_SAMPLES 件たまったモデルにだけ足す（目安のレイテンシだけの間は設定の順を変えない）
+COST_WEIGHT = 0.5
+# ヘッジを投げるまでの待ち時間の下限・上限（秒）
+HEDGE_MIN_SECONDS = 0.5
+HEDGE_MAX_SECONDS = 20.0
+# ヘッジを同時に投げられる数と、呼び出し1回あたりに貯まるヘッジの予算（トークン）・貯められる上限
+HEDGE_WORKERS = int(os.environ.get("LLM_HEDGE_WORKERS", 4))
+HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", 0.1))
+HEDGE_BURST = 3.0
+
+LLM_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "app_llm_requests_total",
+    "モデルルーター経由の LLM 呼び出し回数（結果別）",
+    ("task", "model", "outcome"),
+))
+LLM_HEDGES = metrics.REGISTRY.register(metrics.Counter(
+    "app_llm_hedges_total",
+    "p90 を超えて2つ目のモデルに投げた回数（先に返ったモデル別）",
+    ("task", "winner"),
+))
+
+logger = logging.getLogger(__name__)
+
+
+def parse_routes(text):
+    routes = {}
+    for part in (text or "").split(";"):
+        task, _, models = part.partition("=")
+        models = tuple(m.strip() for m in models.split(",") if m.strip())
+        if task.strip() and models:
+            routes[task.strip()] = models
+    return routes
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class ModelStats:
+    def __init__(self, prior_latency):
+        self.prior_latency = prior_latency
+        self._latencies = deque(maxlen=WINDOW)
+        self._errors = deque(maxlen=WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, ok):
+        with self._lock:
+            if ok:
+                self._latencies.append(seconds)
+            self._errors.append(0 if ok else 1)
+
+    def measured(self):
+        with self._lock:
+            return len(self._latencies) >= MIN_SAMPLES
+
+    def percentile(self, q):
+        with self._lock:
+            latencies = list(self._latencies)
+        if len(latencies) < MIN_SAMPLES:
+            return self.prior_latency
+        return _percentile(latencies, q)
+
+    def error_rate(self):
+        with self._lock:
+            errors = list(self._errors)
+        return sum(errors) / len(errors) if errors else 0.0
+
+
+class ModelRouter:
+    def __init__(self, routes=None, hedge_workers=HEDGE_WORKERS):
+        self.routes = dict(DEFAULT_ROUTES)
+        self.routes.update(routes if routes is not None else parse_routes(os.environ.get("MODEL_ROUTES")))
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._tokens = HEDGE_BURST
+        # ヘッジは空いているワーカーがあるときだけ投げる（待ち行列に入れない）
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="llm-hedge")
+
+    def stats(self, task, model):
+        key = (task, model)
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = ModelStats(MODELS.get(model, (0, 0, 6.0))[2])
+            return self._stats[key]
+
+    def score(self, task, model):
+        stats = self.stats(task, model)
+        price_in, price_out, _ = MODELS.get(model, (1.0, 4.0, 6.0))
+        cost = COST_WEIGHT * (price_in + price_out) if stats.measured() else 0.0
+        return stats.percentile(0.5) * (1 + ERROR_PENALTY * stats.error_rate()) + cost
+
+    #スコアのよい順に候補モデルを返す（同点なら設定の順）
+    def candidates(self, task):
+        models = self.routes[task]
+        return sorted(models, key=lambda m: (self.score(task, m), models.index(m)))
+
+    def choose(self, task):
+        return self.candidates(task)[0]
+
+    def _timed(self, task, model, fn):
+        start = time.perf_counter()
+        try:
+            result = fn(model)
+        except Exception:
+            self.stats(task, model).observe(time.perf_counter() - start, ok=False)
+            LLM_REQUESTS.inc(task=task, model=model, outcome="error")
+            raise
+        self.stats(task, model).observe(time.perf_counter() - start, ok=True)
+        LLM_REQUESTS.inc(task=task, model=model, outcome="ok")
+        return result
+
+    #1つ目のモデルはプールを通さず、専用のスレッドですぐに投げる（待ち時間を遅さとして数えない）
+    def _start(self, task, model, fn):
+        future = Future()
+        ctx = contextvars.copy_context()
+
+        def run():
+            try:
+                future.set_result(ctx.run(self._timed, task, model, fn))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="llm-primary", daemon=True).start()
+        future.model = model
+        return future
+
+    def _can_hedge(self):
+        with self._lock:
+            self._tokens = min(self._tokens + HEDGE_BUDGET, HEDGE_BURST)
+            return self._tokens >= 1
+
+    def _take_hedge(self):
+        with self._lock:
+            if self._tokens < 1 or not self._hedge_slots.acquire(blocking=False):
+                return False
+            self._tokens -= 1
+            return True
+
+    def _hedged(self, task, model, fn):
+        try:
+            return self._timed(task, model, fn)
+        finally:
+            self._hedge_slots.release()
+
+    def _submit_hedge(self, task, model, fn):
+        ctx = contextvars.copy_context()
+        future = self._executor.submit(ctx.run, self._hedged, task, model, fn)
+        future.model = model
+        return future
+
+    #呼び出し元のスレッドで models を順に試す
+    def _call_in_order(self, task, models, fn, error=None):
+        for model in models:
+            try:
+                return self._timed(task, model, fn), model
+            except Exception as e:
+                logger.warning("%s: %s failed, trying next model", task, model, exc_info=True)
+                error = e
+        raise error
+
+    #fn(model) を一番よいモデルで呼び、(結果, 使ったモデル) を返す
+    # 失敗したら次の候補で投げ直す。hedge=True なら p90 を超えたところで次の候補にも投げる。
+    def call(self, task, fn, hedge=False):
+        models = self.candidates(task)
+        if not hedge or len(models) < 2 or not self._can_hedge():
+            return self._call_in_order(task, models, fn)
+
+        primary = self._start(task, models[0], fn)
+        delay = min(max(self.stats(task, models[0]).percentile(0.9), HEDGE_MIN_SECONDS), HEDGE_MAX_SECONDS)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge():
+            try:
+                return primary.result(), models[0]
+            except Exception as e:
+                logger.warning("%s: %s failed, trying next model", task, models[0], exc_info=True)
+                return self._call_in_order(task, models[1:], fn, e)
+
+        pending = {primary, self._submit_hedge(task, models[1], fn)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    LLM_HEDGES.inc(task=task, winner=future.model)
+                    return future.result(), future.model
+                error = future.exception()
+        return self._call_in_order(task, models[2:], fn, error)
+
+
+ROUTER = ModelRouter()
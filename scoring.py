@@ -0,0 +1,116 @@
+#旅行プラン候補スポットのスコアリング
+#
+# 候補ごとに特徴ベクトル（寺 / 神社 / 食 / 景色 / 文化 / 人気度 / 中心への近さ / 写真）を作り、
+# 旅の雰囲気ごとの重みとの内積でスコアを付ける。計算はすべて NumPy でまとめて行うので、
+# 候補が数千件あっても LLM やネットワークを使わずに数ミリ秒で並べ替えられる。
+import numpy as np
+
+
+FEATURES = ("temple", "shrine", "food", "scenery", "culture", "popularity", "centrality", "photo")
+
+CATEGORY_KEYWORDS = {
+    "temple": ("寺", "院", "堂", "仏", "坊"),
+    "shrine": ("神社", "神宮", "大社", "宮", "稲荷"),
+    "food": ("市場", "商店街", "横丁", "食", "料理", "グルメ", "酒", "茶", "屋台", "通り", "小路"),
+    "scenery": ("山", "川", "滝", "湖", "公園", "庭園", "展望", "海", "峡", "岬", "橋", "渓", "景", "浜", "池"),
+    "culture": ("博物館", "美術館", "城", "記念館", "資料館", "劇場", "史跡", "遺跡"),
+}
+
+STYLE_WEIGHTS = {
+    "王道観光": {"temple": 0.5, "shrine": 0.5, "culture": 0.5, "scenery": 0.3, "popularity": 1.0, "centrality": 0.3, "photo": 0.2},
+    "ゆったり": {"scenery": 0.6, "food": 0.3, "temple": 0.2, "popularity": 0.2, "centrality": 1.0, "photo": 0.1},
+    "食べ歩き多め": {"food": 1.0, "popularity": 0.3, "centrality": 0.5, "photo": 0.1},
+    "写真映え": {"scenery": 0.8, "shrine": 0.4, "temple": 0.3, "popularity": 0.3, "centrality": 0.2, "photo": 1.0},
+    "落ち着いた旅": {"temple": 0.8, "scenery": 0.6, "culture": 0.3, "popularity": -0.3, "centrality": 0.3, "photo": 0.1},
+}
+DEFAULT_STYLE = "王道観光"
+
+
+STYLE_KEYWORDS = (
+    ("食べ歩き", "食べ歩き多め"),
+    ("写真映え", "写真映え"),
+    ("ゆったり", "ゆったり"),
+    ("落ち着", "落ち着いた旅"),
+)
+
+
+def style_weights(style):
+    style = style or ""
+    weights = STYLE_WEIGHTS.get(style)
+    if weights is None:
+        # build_trip の tips と同じく部分一致でも判定する
+        for keyword, name in STYLE_KEYWORDS:
+            if keyword in style:
+                weights = STYLE_WEIGHTS[name]
+                break
+        else:
+            weights = STYLE_WEIGHTS[DEFAULT_STYLE]
+    return np.array([weights.get(f, 0.0) for f in FEATURES], dtype=np.float32)
+
+
+def _minmax(values):
+    lo, hi = np.nanmin(values), np.nanmax(values)
+    if not np.isfinite(lo) or hi - lo < 1e-12:
+        return np.zeros_like(values)
+    return (values - lo) / (hi - lo)
+
+
+#特徴行列 (n, len(FEATURES)) を作る
+# features は wiki.get_page_features() の戻り値（{title: {"coords": (lat, lon) or None, "image": bool}}）
+# popularity は候補ごとの人気度（閲覧数など、大きいほど人気）。なければ0として扱う。
+def feature_matrix(titles, features=None, popularity=None):
+    n = len(titles)
+    features = features or {}
+    names = np.array(titles, dtype=str)
+    matrix = np.zeros((n, len(FEATURES)), dtype=np.float32)
+
+    for col, category in enumerate(("temple", "shrine", "food", "scenery", "culture")):
+        mask = np.zeros(n, dtype=bool)
+        for keyword in CATEGORY_KEYWORDS[category]:
+            mask |= np.char.find(names, keyword) >= 0
+        matrix[:, col] = mask
+
+    if popularity is not None:
+        pop = np.asarray(popularity, dtype=np.float64)
+        matrix[:, FEATURES.index("popularity")] = _minmax(np.log1p(np.maximum(pop, 0)))
+
+    coords = np.full((n, 2), np.nan)
+    for i, title in enumerate(titles):
+        c = (features.get(title) or {}).get("coords")
+        if c:
+            coords[i] = c
+    located = ~np.isnan(coords[:, 0])
+    if located.any():
+        center = np.median(coords[located], axis=0)
+        dy = (coords[:, 0] - center[0]) * 110.57
+        dx = (coords[:, 1] - center[1]) * 111.32 * np.cos(np.radians(center[0]))
+        dist = np.hypot(dx, dy)
+        centrality = 1.0 - _minmax(dist)
+        matrix[:, FEATURES.index("centrality")] = np.where(located, centrality, 0.0)
+
+    matrix[:, FEATURES.index("photo")] = [bool((features.get(t) or {}).get("image")) for t in titles]
+    return matrix
+
+
+def score(titles, style, features=None, popularity=None, rng=None, jitter=0.05):
+    matrix = feature_matrix(titles, features, popularity)
+    scores = matrix @ style_weights(style)
+    if jitter and len(titles):
+        # 毎回まったく同じプランにならないよう少しだけ揺らす
+        rng = rng if rng is not None else np.random.default_rng()
+        scores = scores + rng.uniform(0.0, jitter, size=len(titles)).astype(np.float32)
+    return scores
+
+
+#スコアの高い順に k 件のタイトルを返す
+def rank(titles, style, k, features=None, popularity=None, rng=None, jitter=0.05):
+    if not titles:
+        return []
+    scores = score(titles, style, features, popularity, rng, jitter)
+    k = min(k, len(titles))
+    if k < len(titles):
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+    else:
+        top = np.argsort(-scores, kind="stable")
+    return [titles[i] for i in top]
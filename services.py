@@ -0,0 +1,185 @@
+#app.py / app2.py 共通のサービス層
+#
+#   TripPlanner     : 旅行先・日数・雰囲気から1日ずつプランを作る（Wikipedia 検索・スコアリング・スポット説明文）
+#   SouvenirService : 条件からお土産を提案する（LLM・回答のパース・Wikipedia の画像）
+#
+# Wikipedia は wiki.py、LLM は clients.py を通すので、キャッシュ・接続プール・計測はどちらのアプリでも同じものが効く。
+# アプリごとに違うのは提案するお土産の数だけ（factory.create_app の souvenir_count）。
+# 旅行プランは設定によらないので、1つの TRIPS をどのアプリからも使う。
+import contextvars
+import copy
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import clients
+import enrich
+import metrics
+import places
+import prompts
+import scoring
+import trip_planner
+import wiki
+from cache import MISSING, LRUCache
+
+
+TIME_SLOTS = ["09:00", "11:00", "12:30", "15:00", "18:00"]
+SLOT_LABELS = ["朝", "午前", "昼", "午後", "夜"]
+
+
+class TripPlanner:
+    def __init__(self, descriptions, cache_size=2048):
+        # スポット名 -> 説明文（LLM で生成し、ファイルにも保存する）
+        self.descriptions = descriptions
+        # (destination, days, style, seed) -> プラン。共有URLで開いたときは Wikipedia を呼ばずに返す
+        self._cache = LRUCache("trip_plans", maxsize=cache_size)
+
+    #旅行プランを1日分ずつ yield する。全日程がそろったら seed ごとにキャッシュする
+    def iter_trip(self, destination, days, style, seed=None):
+        # 「京都府」「kyoto」なども同じキャッシュに当たるよう正規名にそろえる
+        destination = places.canonical(destination)
+        key = (destination, days, style, seed)
+        if seed is not None:
+            cached = self._cache.get(key)
+            if cached is not MISSING:
+                yield from copy.deepcopy(cached)
+                return
+
+        # seed が同じなら同じプランになるよう、乱数は自前の Random だけを使う
+        rng = random.Random(seed)
+        # スポット説明文はこの時刻までに届いた分だけ使う
+        deadline = time.monotonic() + enrich.BUDGET_SECONDS
+
+        candidates = []
+        search_rank = {}
+        for q in [f"{destination} 観光", f"{destination} 名所", f"{destination} 寺", f"{destination} 神社"]:
+            for rank, t in enumerate(wiki.search_titles(q, limit=10)):
+                candidates.append(t)
+                search_rank[t] = min(rank, search_rank.get(t, rank))
+
+        # 重複除去
+        pool = list(dict.fromkeys(candidates))
+
+        if len(pool) < days * 5:
+            pool += [
+                f"{destination}中心街散策",
+                f"{destination}の寺社エリア",
+                f"{destination}の景色スポット",
+                f"{destination}の商店街・市場",
+                f"{destination}の文化施設",
+                f"{destination}の自然スポット",
+            ]
+
+        if "食べ歩き" in style:
+            tips_base = "食べ歩きがしやすいエリアを中心に。混む時間をずらすと◎"
+        elif "写真映え" in style:
+            tips_base = "光が綺麗な夕方を意識。たくさんの場所を回れるように移動時間は少なめに。"
+        elif "ゆったり" in style:
+            tips_base = "移動少なめ。カフェ休憩を挟んでゆったり回る。"
+        else:
+            tips_base = "王道スポットは朝に。午後は近場でまとめると効率的。"
+
+        need = days * len(TIME_SLOTS)
+
+        # 旅の雰囲気に合うスポットを優先して選ぶ
+        # 人気度は検索順位を使う（同じ seed なら別のワーカーや再起動のあとでも同じプランになるよう、時期で変わる値は使わない）
+        features = wiki.get_page_features(pool)
+        popularity = [1.0 / (1 + search_rank[t]) if t in search_rank else 0.0 for t in pool]
+        ranked = scoring.rank(
+            pool, style, need, features=features, popularity=popularity,
+            rng=np.random.default_rng(rng.getrandbits(64)),
+        )
+        picks = ranked if len(ranked) >= need else (ranked * ((need // len(ranked)) + 1))[:need]
+
+        # 近いスポット同士を同じ日にまとめ、移動が短い順に並べる
+        coords = {t: features[t]["coords"] for t in picks}
+        day_titles = trip_planner.iter_arrange(picks, coords, days, len(TIME_SLOTS), rng=rng)
+
+        # 全スポットの説明文の生成を先に始めておき、各日はその日の分だけ待つ
+        self.descriptions.prefetch(picks, destination)
+
+        plan = []
+        for d, titles in enumerate(day_titles, start=1):
+            descriptions = self.descriptions.describe(titles, destination, deadline=deadline)
+            schedule = []
+            for i, (t, title) in enumerate(zip(TIME_SLOTS, titles)):
+                if title in descriptions:
+                    detail = descriptions[title]
+                elif SLOT_LABELS[i] == "昼":
+                    detail = "近くで休憩・ランチを想定。無理のない移動距離で。"
+                else:
+                    detail = "同じエリア内で無理なく巡るプランです。"
+                schedule.append({
+                    "time": t,
+                    "title": title,
+                    "detail": detail,
+                    "tips": tips_base
+                })
+            day = {"day": d, "schedule": schedule}
+            plan.append(day)
+            yield copy.deepcopy(day)
+
+        if seed is not None:
+            self._cache.set(key, plan)
+
+    def build_trip(self, destination, days, style, seed=None):
+        return list(self.iter_trip(destination, days, style, seed))
+
+    #作成済み（キャッシュにある）のプランだけを返す。なければ None
+    def cached(self, destination, days, style, seed):
+        cached = self._cache.get((places.canonical(destination), days, style, seed))
+        return None if cached is MISSING else copy.deepcopy(cached)
+
+
+#AIの回答から (お土産名, 説明) を最大 count 件取り出す
+# 「1. 〇〇：説明」の行だけ拾う（前置き・締めの文や、説明の続きの行は飛ばす）
+def parse_souvenirs(text, count):
+    items = []
+    for line in (text or "").split("\n"):
+        m = re.match(r"^\d+\.\s*(.+?)：(.*)$", line.strip())
+        if m:
+            name = m.group(1).strip().replace("（", "").replace("）", "")
+            items.append((name, m.group(2).strip()))
+    return items[:count]
+
+
+# お土産の画像は1件ずつ取りに行くので並列にする
+_image_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="souvenir-images")
+
+
+class SouvenirService:
+    def __init__(self, count):
+        self.count = count
+        # お土産提案のプロンプト（固定部分は起動時に1回だけ組み立てる）
+        self.prompt = prompts.SouvenirPrompt(count=count)
+
+    def parse(self, text):
+        return parse_souvenirs(text, self.count)
+
+    #フォームの条件からお土産を提案する。[{"name", "description", "image"}]
+    def suggest(self, form):
+        messages, prompt_tokens = self.prompt.build(form)
+
+        # 遅いモデルに当たったときは p90 を過ぎたところで別のモデルにも投げる
+        with metrics.stage("llm_completion"):
+            text, model = clients.chat(
+                "souvenir", messages, hedge=True, attributes={"prompt.estimated_tokens": prompt_tokens},
+            )
+
+        with metrics.stage("parse_response"):
+            items = self.parse(text)
+
+        images = [
+            _image_executor.submit(contextvars.copy_context().run, wiki.get_image, name)
+            for name, _ in items
+        ]
+        return [
+            {"name": name, "description": desc, "image": image.result()}
+            for (name, desc), image in zip(items, images)
+        ]
+
+
+TRIPS = TripPlanner(enrich.DescriptionStore(enrich.openai_generator()))
@@ -0,0 +1,130 @@
+import random
+from collections import defaultdict
+
+import ledger as ledger_module
+
+LEDGER_ID = "test-ledger-0001"
+CATEGORIES = ["食事", "交通", "宿泊", "お土産"]
+DAYS = ["2026-10-01", "2026-10-02", "2026-10-03"]
+
+
+#追記ログを Python 側でそのまま持ち、合計を毎回数え直す
+class Model:
+    def __init__(self):
+        self.seen = set()
+        self.adds = {}
+        self.deleted = set()
+        self.order = []
+        self.budget = 0
+
+    def apply(self, change):
+        key = (change["op"], change["id"])
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        if change["op"] == "add":
+            self.adds[change["id"]] = change
+            self.order.append(change["id"])
+        elif change["op"] == "delete":
+            self.deleted.add(change["id"])
+        else:
+            self.budget = change["amount"]
+
+    def live(self):
+        return [self.adds[i] for i in self.order if i not in self.deleted]
+
+    def summary(self):
+        categories = defaultdict(lambda: [0, 0])
+        days = defaultdict(lambda: [0, 0])
+        for c in self.live():
+            for group, key in ((categories, c["category"]), (days, c["day"])):
+                group[key][0] += c["amount"]
+                group[key][1] += 1
+        live = self.live()
+        return {
+            "budget": self.budget,
+            "used": sum(c["amount"] for c in live),
+            "count": len(live),
+            "categories": {k: tuple(v) for k, v in categories.items()},
+            "days": {k: tuple(v) for k, v in days.items()},
+        }
+
+
+def random_change(rng, model, n):
+    roll = rng.random()
+    if roll < 0.1 and model.seen:
+        op, entry_id = rng.choice(sorted(model.seen))
+        change = dict(model.adds[entry_id]) if op == "add" else {"op": op, "id": entry_id, "amount": rng.randrange(100000)}
+        if op == "delete":
+            del change["amount"]
+        return change
+    if roll < 0.3 and model.order:
+        return {"op": "delete", "id": rng.choice(model.order)}
+    if roll < 0.35:
+        # まだ追加されていない支出の削除（別の端末の削除が先に届いた場合）
+        return {"op": "delete", "id": f"entry-{n + rng.randrange(1, 20):06d}"}
+    if roll < 0.4:
+        return {"op": "budget", "id": f"budget-{n:06d}", "amount": rng.randrange(10 ** 7)}
+    return {
+        "op": "add",
+        "id": f"entry-{n:06d}",
+        "amount": rng.randrange(1, 50000),
+        "category": rng.choice(CATEGORIES),
+        "date": "10/1",
+        "time": "12:00",
+        "day": rng.choice(DAYS),
+    }
+
+
+def actual_summary(ledger):
+    s = ledger.summary(LEDGER_ID)
+    return {
+        "budget": s["budget"],
+        "used": s["used"],
+        "count": s["count"],
+        "categories": {c["key"]: (c["amount"], c["count"]) for c in s["categories"]},
+        "days": {d["key"]: (d["amount"], d["count"]) for d in s["days"]},
+    }
+
+
+def all_entries(ledger):
+    entries, before = [], None
+    while True:
+        page, before = ledger.entries(LEDGER_ID, limit=37, before=before)
+        entries.extend(page)
+        if before is None:
+            return entries
+
+
+#ランダムな 2000 件の追加・削除・予算変更・送り直しのあとで、集計が履歴を数え直した値と一致するか見る
+def test_totals_match_log_after_random_operations(tmp_path):
+    rng = random.Random(20261019)
+    ledger = ledger_module.Ledger(str(tmp_path / "ledger.db"))
+    model = Model()
+    n = 0
+    while n < 2000:
+        batch = []
+        for _ in range(rng.randrange(1, 20)):
+            batch.append(random_change(rng, model, n))
+            n += 1
+        ledger.append(LEDGER_ID, batch)
+        for change in batch:
+            model.apply(change)
+        assert actual_summary(ledger) == model.summary()
+
+    live = model.live()
+    assert [e["id"] for e in all_entries(ledger)] == [c["id"] for c in reversed(live)]
+    page = ledger.page(LEDGER_ID)
+    assert page["used"] == sum(c["amount"] for c in live)
+    assert page["budget"] == model.budget
+
+
+#別の台帳の変更は集計に混ざらない
+def test_totals_are_per_ledger(tmp_path):
+    ledger = ledger_module.Ledger(str(tmp_path / "ledger.db"))
+    ledger.append(LEDGER_ID, [{"op": "add", "id": "entry-000001", "amount": 500, "category": "食事", "day": DAYS[0]}])
+    ledger.append("other-ledger-01", [{"op": "add", "id": "entry-000001", "amount": 700, "category": "食事", "day": DAYS[0]}])
+    ledger.append("other-ledger-01", [{"op": "delete", "id": "entry-000001"}])
+    assert ledger.summary(LEDGER_ID)["used"] == 500
+    assert ledger.summary("other-ledger-01")["used"] == 0
+    assert ledger.summary("other-ledger-01")["categories"] == []
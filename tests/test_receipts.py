@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import receipts
+
+
+def answer(amount, line, currency="JPY"):
+    return json.dumps({"amount": amount, "currency": currency, "confidence": 0.9, "line": line})
+
+
+@pytest.mark.parametrize("amount, line, currency", [
+    (1234, "合計 ¥1,234", "JPY"),
+    (12.5, "TOTAL US$ 12.50", "USD"),
+    (1234.5, "TOTAL $1,234.50", "USD"),
+    (12.5, "TOTAL 12,50 €", "EUR"),
+    (1299, "Summe EUR 1.299,00", "EUR"),
+    (1234000, "TOTAL 1.234.000 ₫", "VND"),
+    (150000, "TOTAL Rp 150.000", "IDR"),
+    (500, "合計", "JPY"),
+])
+def test_parse_receipt_accepts_amount_written_in_line(amount, line, currency):
+    result = receipts.parse_receipt(answer(amount, line, currency))
+    assert result["amount"] == amount
+    assert result["currency"] == currency
+
+
+@pytest.mark.parametrize("amount, line", [
+    (12342, "1,234円（税込）2"),
+    (1, "合計 1,234円"),
+    (1250, "TOTAL 12,50 €"),
+    (1299, "Summe EUR 12.99"),
+])
+def test_parse_receipt_rejects_amount_not_in_line(amount, line):
+    with pytest.raises(receipts.InvalidReceipt) as e:
+        receipts.parse_receipt(answer(amount, line))
+    assert e.value.reason == "line"
@@ -0,0 +1,283 @@
+#リクエスト単位のトレース（スパン）
+#
+# OpenTelemetry と同じ形（trace_id / span_id / parent / 属性 / 開始・終了時刻）で
+# スパンを記録する。出力先は環境変数 TRACE_EXPORTER で切り替える。
+#   none    : 何もしない（デフォルト、オーバーヘッドほぼゼロ）
+#   console : 標準エラーに JSON で1行ずつ出力
+#   file    : TRACE_FILE（デフォルト traces.jsonl）に JSON Lines で追記
+#   otel    : opentelemetry パッケージがあればそちらの tracer を使う
+# どの設定でもリクエストIDは発行し、ログとレスポンスヘッダー（X-Request-ID）に載せる。
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+from flask.logging import default_handler
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_request_id = contextvars.ContextVar("request_id", default="-")
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "start_ns", "end_ns", "status", "events")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "UNSET"
+        self.events = []
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = "ERROR"
+        self.events.append({
+            "name": "exception",
+            "timeUnixNano": time.time_ns(),
+            "attributes": {"exception.type": type(exc).__name__, "exception.message": str(exc)},
+        })
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status},
+            "events": self.events,
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class ConsoleExporter:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_exporter = None
+_otel_tracer = None
+
+
+def configure(kind=None, path=None):
+    global _exporter, _otel_tracer
+    kind = (kind or os.environ.get("TRACE_EXPORTER", "none")).lower()
+    _exporter = None
+    _otel_tracer = None
+    if kind == "console":
+        _exporter = ConsoleExporter()
+    elif kind == "file":
+        _exporter = FileExporter(path or os.environ.get("TRACE_FILE", "traces.jsonl"))
+    elif kind == "otel":
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logging.getLogger(__name__).warning(
+                "TRACE_EXPORTER=otel ですが opentelemetry がインストールされていません"
+            )
+        else:
+            _otel_tracer = trace.get_tracer("teamGeminiAPI")
+
+
+def enabled():
+    return _exporter is not None or _otel_tracer is not None
+
+
+#スパンを開始する
+# with span("wiki_search_titles", query=query) as s:
+#     ...
+#     s.set_attribute("result_count", len(titles))
+@contextmanager
+def span(name, **attributes):
+    if _otel_tracer is not None:
+        attributes.setdefault("request.id", _request_id.get())
+        with _otel_tracer.start_as_current_span(name, attributes=attributes) as s:
+            yield s
+        return
+
+    if _exporter is None:
+        yield _NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    attributes.setdefault("request.id", _request_id.get())
+
+    s = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end_ns = time.time_ns()
+        if s.status == "UNSET":
+            s.status = "OK"
+        _exporter.export(s)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+#ストリーミングのレスポンス（ジェネレーター）を、ビューと同じトレース・リクエストIDの中で動かす
+# ビューの中で呼ぶ。ルートスパンは teardown ではなく、送り終えたときに閉じる。
+#   return Response(stream_with_context(tracing.stream(events())), ...)
+def stream(generator):
+    cm = g.pop("trace_cm", None)
+    root = g.get("trace_span")
+    rid = g.get("request_id", "-")
+
+    def run():
+        _request_id.set(rid)
+        if isinstance(root, Span):
+            _current_span.set(root)
+        error = None
+        try:
+            yield from generator
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if cm is not None:
+                if error is not None:
+                    cm.__exit__(type(error), error, error.__traceback__)
+                else:
+                    cm.__exit__(None, None, None)
+            _current_span.set(None)
+            _request_id.set("-")
+
+    return run()
+
+
+#ログレコードに request_id を付ける
+_base_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs):
+    record = _base_record_factory(*args, **kwargs)
+    record.request_id = _request_id.get()
+    return record
+
+
+logging.setLogRecordFactory(_record_factory)
+
+
+def _start_root_span(name, attributes):
+    # 受け取った traceparent があれば同じトレースの子として続ける
+    parent = None
+    m = _TRACEPARENT_RE.match(request.headers.get("traceparent", ""))
+    if m and _exporter is not None:
+        parent = Span("remote", m.group(1), None, {})
+        parent.span_id = m.group(2)
+        _current_span.set(parent)
+    cm = span(name, **attributes)
+    return cm, cm.__enter__()
+
+
+def init_app(app):
+    default_handler.setFormatter(logging.Formatter(
+        "[%(asctime)s] %(levelname)s [%(request_id)s] in %(module)s: %(message)s"
+    ))
+
+    @app.before_request
+    def _begin_trace():
+        # 受け取った ID はログやファイル名にも使うので、決まった文字だけのものしか引き継がない
+        rid = request.headers.get(REQUEST_ID_HEADER, "")
+        if not _REQUEST_ID_RE.match(rid):
+            rid = secrets.token_hex(8)
+        g.request_id = rid
+        _request_id.set(rid)
+        g.trace_start = time.perf_counter()
+        g.trace_cm, g.trace_span = _start_root_span(
+            f"{request.method} {request.path}",
+            {"http.method": request.method, "http.route": request.path},
+        )
+
+    @app.after_request
+    def _tag_response(response):
+        response.headers[REQUEST_ID_HEADER] = g.get("request_id", "-")
+        s = g.get("trace_span")
+        if s is not None and getattr(s, "trace_id", None):
+            s.set_attribute("http.status_code", response.status_code)
+            response.headers["traceparent"] = f"00-{s.trace_id}-{s.span_id}-01"
+        app.logger.info(
+            "%s %s -> %s (%.1f ms)",
+            request.method, request.path, response.status_code,
+            (time.perf_counter() - g.get("trace_start", time.perf_counter())) * 1000,
+        )
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        cm = g.pop("trace_cm", None)
+        if cm is not None:
+            if exc is not None:
+                cm.__exit__(type(exc), exc, exc.__traceback__)
+            else:
+                cm.__exit__(None, None, None)
+        _current_span.set(None)
+        _request_id.set("-")
+
+
+configure()
@@ -0,0 +1,147 @@
+#旅行プランの地理的な並べ替え
+#
+# 候補スポットを日ごとに近いもの同士でまとめ（k-means + 定員つき割り当て）、
+# 各日の中は最近傍法 + 2-opt で移動距離が短くなる順に並べる。
+# 7日 × 5枠 = 35地点程度なら数ミリ秒で終わる。
+import math
+import random
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(a, b):
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def project(coords):
+    # 緯度経度を km 単位の平面座標に変換（正距円筒図法、県内程度の範囲なら十分）
+    lat0 = math.radians(sum(c[0] for c in coords) / len(coords))
+    kx = 111.32 * math.cos(lat0)
+    return [(c[1] * kx, c[0] * 110.57) for c in coords]
+
+
+def _dist(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def kmeans(points, k, iterations=20, rng=random):
+    # k-means++ で初期値を選ぶ
+    centroids = [points[rng.randrange(len(points))]]
+    while len(centroids) < k:
+        weights = [min(_dist(p, c) ** 2 for c in centroids) for p in points]
+        total = sum(weights)
+        if total == 0:
+            centroids.append(points[rng.randrange(len(points))])
+            continue
+        r = rng.random() * total
+        for p, w in zip(points, weights):
+            r -= w
+            if r <= 0:
+                centroids.append(p)
+                break
+        else:
+            centroids.append(points[-1])
+
+    for _ in range(iterations):
+        groups = [[] for _ in range(k)]
+        for p in points:
+            groups[min(range(k), key=lambda c: _dist(p, centroids[c]))].append(p)
+        moved = False
+        for c, group in enumerate(groups):
+            if not group:
+                continue
+            new = (sum(p[0] for p in group) / len(group), sum(p[1] for p in group) / len(group))
+            if new != centroids[c]:
+                centroids[c] = new
+                moved = True
+        if not moved:
+            break
+    return centroids
+
+
+def balanced_assign(points, centroids, capacity):
+    # 近い組み合わせから順に、定員に空きがあるクラスタへ割り当てる
+    pairs = sorted(
+        (_dist(p, c), i, ci)
+        for i, p in enumerate(points)
+        for ci, c in enumerate(centroids)
+    )
+    groups = [[] for _ in centroids]
+    assigned = set()
+    for _, i, ci in pairs:
+        if i in assigned or len(groups[ci]) >= capacity:
+            continue
+        groups[ci].append(i)
+        assigned.add(i)
+    return groups
+
+
+def order_route(indices, points):
+    if len(indices) <= 2:
+        return list(indices)
+
+    # 最近傍法：クラスタの中心から一番遠い点（端の点）から始める
+    cx = sum(points[i][0] for i in indices) / len(indices)
+    cy = sum(points[i][1] for i in indices) / len(indices)
+    start = max(indices, key=lambda i: _dist(points[i], (cx, cy)))
+    route = [start]
+    rest = set(indices) - {start}
+    while rest:
+        last = points[route[-1]]
+        nxt = min(rest, key=lambda i: _dist(points[i], last))
+        route.append(nxt)
+        rest.remove(nxt)
+
+    # 2-opt（始点・終点が固定されない開いた経路）
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                a = points[route[i - 1]] if i > 0 else None
+                b, c = points[route[i]], points[route[j]]
+                d = points[route[j + 1]] if j + 1 < len(route) else None
+                before = (_dist(a, b) if a else 0) + (_dist(c, d) if d else 0)
+                after = (_dist(a, c) if a else 0) + (_dist(b, d) if d else 0)
+                if after + 1e-9 < before:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+#タイトルを days 日 × per_day 枠に並べ、1日分ずつ返す
+# coords は {title: (lat, lon) or None}。座標のないタイトルは空いた枠に後から入れる。
+# 日への振り分けは最初にまとめて行い、各日の順路（2-opt）はその日を返す直前に計算する。
+def iter_arrange(titles, coords, days, per_day, rng=random):
+    located = [i for i, t in enumerate(titles) if coords.get(t)]
+    unlocated = [i for i, t in enumerate(titles) if not coords.get(t)]
+
+    day_groups = [[] for _ in range(days)]
+    points = None
+    k = min(days, len(located))
+    if k >= 1:
+        points = project([coords[titles[i]] for i in located])
+        centroids = kmeans(points, k, rng=rng)
+        groups = balanced_assign(points, centroids, per_day)
+        # 西から東へ日を並べる
+        groups.sort(key=lambda g: min(points[i][0] for i in g) if g else float("inf"))
+        for d, group in enumerate(groups):
+            day_groups[d] = group
+
+    rest = iter(unlocated)
+    for group in day_groups:
+        day = [located[i] for i in order_route(group, points)] if group else []
+        while len(day) < per_day:
+            nxt = next(rest, None)
+            if nxt is None:
+                break
+            day.append(nxt)
+        yield [titles[i] for i in day]
+
+
+def arrange(titles, coords, days, per_day, rng=random):
+    return list(iter_arrange(titles, coords, days, per_day, rng))
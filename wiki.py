@@ -0,0 +1,304 @@
+#Wikipedia (MediaWiki API) の共通処理
+import contextvars
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import tracing
+from cache import MISSING, LRUCache
+
+
+WIKI_ENDPOINT = os.environ.get("WIKI_ENDPOINT", "https://ja.wikipedia.org/w/api.php")
+
+HEADERS = {
+    "User-Agent": "TripPlannerApp/1.0 (edu; contact: student@example.com)",
+    "Accept-Language": "ja,en;q=0.8",
+}
+
+# titles= に一度に渡せる上限
+MAX_TITLES = 50
+
+_page_features_cache = LRUCache("wiki_page_features", maxsize=20000)
+# 検索結果は1日キャッシュする（旅行先は places.canonical() でそろえてから検索するのでヒットしやすい）
+_search_cache = LRUCache("wiki_search", maxsize=4096, ttl=24 * 60 * 60)
+# お土産名 -> サムネイル画像の URL（画像がない記事は None）
+_image_cache = LRUCache("wiki_images", maxsize=4096, ttl=24 * 60 * 60)
+
+# ヘッジ（遅いリクエストと同じものをもう1本投げる）の設定
+# 呼び出し先ごとの直近の実測 p95 を過ぎても返ってこなければ2本目を投げ、先に返った方を使う。
+# 2本目を投げられるのはリクエスト数の HEDGE_BUDGET 割合まで（Wikipedia に負荷をかけすぎないため）。
+# 1本目は待ち行列に入れずにすぐ投げ、2本目だけを HEDGE_WORKERS 本のプールから空きがあるときに投げる。
+HEDGE_QUANTILE = 0.95
+HEDGE_BUDGET = float(os.environ.get("WIKI_HEDGE_BUDGET", 0.05))
+HEDGE_BURST = 5.0
+HEDGE_DEFAULT_SECONDS = 1.0
+HEDGE_MIN_SECONDS = 0.05
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+HEDGE_WORKERS = int(os.environ.get("WIKI_HEDGE_WORKERS", 8))
+
+WIKI_HEDGES = metrics.REGISTRY.register(metrics.Counter(
+    "app_wiki_hedges_total",
+    "Wikipedia へのヘッジリクエスト数（先に返った方別）",
+    ("upstream", "winner"),
+))
+
+# 接続は使い回す（リクエストを処理するスレッドとヘッジのスレッドが同時に使う分だけ、ホストごとに接続を持てるようにする）
+POOL_SIZE = int(os.environ.get("WIKI_POOL_SIZE", 64))
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+SESSION.mount("http://", HTTPAdapter(pool_maxsize=POOL_SIZE))
+
+
+class _Hedger:
+    def __init__(self, max_workers=HEDGE_WORKERS):
+        self._latencies = {}
+        self._tokens = HEDGE_BURST
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wiki-hedge")
+
+    def _observe(self, name, seconds):
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=HEDGE_WINDOW)).append(seconds)
+
+    def threshold(self, name):
+        with self._lock:
+            latencies = sorted(self._latencies.get(name, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_SECONDS
+        return max(latencies[max(0, math.ceil(HEDGE_QUANTILE * len(latencies)) - 1)], HEDGE_MIN_SECONDS)
+
+    def _can_hedge(self):
+        with self._lock:
+            self._tokens = min(self._tokens + HEDGE_BUDGET, HEDGE_BURST)
+            return self._tokens >= 1
+
+    def _take_hedge(self):
+        with self._lock:
+            if self._tokens < 1 or not self._slots.acquire(blocking=False):
+                return False
+            self._tokens -= 1
+            return True
+
+    def _get(self, name, url, kwargs):
+        start = time.perf_counter()
+        r = SESSION.get(url, **kwargs)
+        self._observe(name, time.perf_counter() - start)
+        return r
+
+    #1本目はプールを通さず、専用のスレッドですぐに投げる（待ち時間を遅さとして数えない）
+    def _start(self, name, url, kwargs):
+        future = Future()
+        ctx = contextvars.copy_context()
+
+        def run():
+            try:
+                future.set_result(ctx.run(self._get, name, url, kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="wiki-primary", daemon=True).start()
+        return future
+
+    def _hedged(self, name, url, kwargs):
+        try:
+            return self._get(name, url, kwargs)
+        finally:
+            self._slots.release()
+
+    def _submit_hedge(self, name, url, kwargs):
+        ctx = contextvars.copy_context()
+        return self._executor.submit(ctx.run, self._hedged, name, url, kwargs)
+
+    #ヘッジできないとき（予算切れ）は呼び出し元のスレッドでそのまま投げる
+    def get(self, name, url, **kwargs):
+        if not self._can_hedge():
+            return self._get(name, url, kwargs)
+        primary = self._start(name, url, kwargs)
+        done, _ = wait([primary], timeout=self.threshold(name))
+        if done or not self._take_hedge():
+            return primary.result()
+
+        hedge = self._submit_hedge(name, url, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    WIKI_HEDGES.inc(upstream=name, winner="primary" if future is primary else "hedge")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+_hedger = _Hedger()
+
+
+#requests.get と同じ引数で呼べるヘッジつき GET（name は実測値を分ける呼び出し先の名前）
+def hedged_get(name, url, **kwargs):
+    return _hedger.get(name, url, **kwargs)
+
+
+#接続プールに connections 本の接続を張っておく（ワーカーがリクエストを受ける前に呼ぶ）
+def warmup(connections=4, timeout=5):
+    params = {"action": "query", "format": "json", "meta": "siteinfo"}
+    futures = [
+        _hedger._executor.submit(SESSION.get, WIKI_ENDPOINT, params=params, headers=HEADERS, timeout=timeout)
+        for _ in range(connections)
+    ]
+    for future in futures:
+        future.result().close()
+
+
+#全文検索して記事タイトルを返す（list=search）
+def search_titles(query, limit=10):
+    cached = _search_cache.get((query, limit))
+    if cached is not MISSING:
+        return list(cached)
+
+    params = {
+        "action": "query",
+        "list": "search",
+        "srsearch": query,
+        "format": "json",
+        "srlimit": str(limit),
+    }
+    with tracing.span("wiki_search_titles", query=query, limit=limit) as span, \
+            metrics.stage("wiki_search_titles"), metrics.upstream("wikipedia_search") as call:
+        r = hedged_get("wikipedia_search", WIKI_ENDPOINT, params=params, headers=HEADERS, timeout=10)
+        call.status = r.status_code
+        span.set_attribute("http.status_code", r.status_code)
+    r.raise_for_status()
+    data = r.json()
+    titles = []
+    for item in data.get("query", {}).get("search", []):
+        title = re.sub(r"<.*?>", "", item.get("title", ""))
+        if title:
+            titles.append(title)
+    _search_cache.set((query, limit), titles)
+    return list(titles)
+
+
+#記事の代表画像（幅 300px のサムネイル）の URL。画像がなければ None
+def get_image(title):
+    cached = _image_cache.get(title)
+    if cached is not MISSING:
+        return cached
+
+    params = {
+        "action": "query",
+        "format": "json",
+        "titles": title,
+        "prop": "pageimages",
+        "pithumbsize": 300,
+        "redirects": 1
+    }
+    with tracing.span("get_wikipedia_image", title=title) as span, \
+            metrics.stage("get_wikipedia_image"), metrics.upstream("wikipedia_pageimages") as call:
+        res = hedged_get("wikipedia_pageimages", WIKI_ENDPOINT, params=params, headers=HEADERS, timeout=10)
+        call.status = res.status_code
+        span.set_attribute("http.status_code", res.status_code)
+
+    # 失敗したときはキャッシュしない
+    if res.status_code != 200:
+        return None
+
+    image = None
+    for page in res.json().get("query", {}).get("pages", {}).values():
+        if "thumbnail" in page:
+            image = page["thumbnail"]["source"]
+            break
+    _image_cache.set(title, image)
+    return image
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _resolve_titles(query):
+    # normalized / redirects をたどって 元タイトル -> 最終タイトル の対応を作る
+    mapping = {}
+    for key in ("normalized", "redirects"):
+        for item in query.get(key, []):
+            mapping[item["from"]] = item["to"]
+
+    def resolve(title):
+        seen = set()
+        while title in mapping and title not in seen:
+            seen.add(title)
+            title = mapping[title]
+        return title
+
+    return resolve
+
+
+#記事タイトルの緯度経度と代表画像の有無をまとめて取得（prop=coordinates|pageimages）
+# 戻り値は {title: {"coords": (lat, lon) or None, "image": bool}}。
+# 記事がない・座標がないタイトルもそのままキャッシュする。
+def get_page_features(titles):
+    result = {}
+    missing = []
+    for title in dict.fromkeys(titles):
+        cached = _page_features_cache.get(title)
+        if cached is MISSING:
+            missing.append(title)
+        else:
+            result[title] = cached
+
+    for chunk in _chunks(missing, MAX_TITLES):
+        params = {
+            "action": "query",
+            "format": "json",
+            "prop": "coordinates|pageimages",
+            "titles": "|".join(chunk),
+            "coprimary": "primary",
+            "colimit": "max",
+            "piprop": "name",
+            "pilimit": "max",
+            "redirects": 1,
+        }
+        try:
+            with tracing.span("wiki_page_features", titles=len(chunk)) as span, \
+                    metrics.stage("wiki_page_features"), metrics.upstream("wikipedia_page_features") as call:
+                r = hedged_get("wikipedia_page_features", WIKI_ENDPOINT, params=params, headers=HEADERS, timeout=10)
+                call.status = r.status_code
+                span.set_attribute("http.status_code", r.status_code)
+            r.raise_for_status()
+            query = r.json().get("query", {})
+        except (requests.RequestException, ValueError):
+            # 取れなかった分はキャッシュせず情報なし扱い
+            for title in chunk:
+                result[title] = {"coords": None, "image": False}
+            continue
+
+        found = {}
+        for page in query.get("pages", {}).values():
+            coords = page.get("coordinates")
+            found[page.get("title")] = {
+                "coords": (coords[0]["lat"], coords[0]["lon"]) if coords else None,
+                "image": "pageimage" in page,
+            }
+
+        resolve = _resolve_titles(query)
+        for title in chunk:
+            value = found.get(resolve(title), {"coords": None, "image": False})
+            _page_features_cache.set(title, value)
+            result[title] = value
+
+    return result
+
+
+def get_coordinates(titles):
+    return {t: f["coords"] for t, f in get_page_features(titles).items()}